@@ -1,6 +1,5 @@
 import os
 from flask import Flask
-from datetime import timedelta
 from .config import Config
 from .extensions import db, jwt, socketio, limiter, cors
 from .models import * # Import models to be registered
@@ -20,15 +19,39 @@ def create_app(config_class=Config):
     # Initialize extensions
     db.init_app(app)
     jwt.init_app(app)
-    socketio.init_app(app)
+    socketio.init_app(app, message_queue=app.config['SOCKETIO_MESSAGE_QUEUE'], channel=app.config['SOCKETIO_CHANNEL'])
     limiter.init_app(app)
     cors.init_app(app, resources={r"/api/*": {"origins": "*"}}) # Apply CORS only to API routes
 
+    from .outbox import outbox
+    outbox.init_app(app)
+    from .presence import presence
+    presence.init_app(app)
+    from .search import search_index
+    search_index.init_app(app)
+    from .graph import graph_cache
+    graph_cache.init_app(app)
+    from .typeahead import user_prefix_index
+    user_prefix_index.init_app(app)
+    from .sentiment import sentiment_scorer
+    sentiment_scorer.init_app(app)
+    from .storage import media_storage
+    media_storage.init_app(app)
+    from .stories import story_sweeper, story_views
+    story_sweeper.init_app(app)
+    story_views.init_app(app)
+    from .timeline import timeline_trimmer
+    timeline_trimmer.init_app(app)
+    from .media import media_pipeline
+    media_pipeline.init_app(app)
+    from .metrics import request_metrics
+    request_metrics.init_app(app)
+    from .query_budget import init_query_budget
+    init_query_budget(app)
+
     # Create upload folders
-    os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
-    os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'profiles'), exist_ok=True)
-    os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'posts'), exist_ok=True)
-    os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'stories'), exist_ok=True)
+    for folder in ('blobs', 'tmp'):
+        os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], folder), exist_ok=True)
 
     # Register Blueprints (routes)
     from .routes.main import main_bp
@@ -49,7 +72,34 @@ def create_app(config_class=Config):
     app.register_blueprint(notifications_bp, url_prefix='/api')
     app.register_blueprint(stories_bp, url_prefix='/api')
 
+    from .pagination import InvalidCursor, handle_invalid_cursor
+    app.register_error_handler(InvalidCursor, handle_invalid_cursor)
+    from .media import InvalidImage, MediaProcessingTimeout, handle_invalid_image, handle_processing_timeout
+    app.register_error_handler(InvalidImage, handle_invalid_image)
+    app.register_error_handler(MediaProcessingTimeout, handle_processing_timeout)
+
     # Import socket handlers to register them
     from .sockets import handlers
 
+    # Register CLI commands (flask rebuild-counters, ...)
+    from .commands import register_commands
+    register_commands(app)
+
+    # Fingerprinted static URLs in templates ({{ asset_url('js/main.js') }})
+    from .serving import register_static_assets
+    register_static_assets(app)
+
     return app
+
+def start_background_tasks(app):
+    """
+    Starts the periodic loops of a serving process. Called by run.py, not
+    create_app(), so CLI commands, db_init.py and startup probes stay inert.
+    """
+    from .stories import story_sweeper
+    story_sweeper.start()
+    from .typeahead import user_prefix_index
+    user_prefix_index.start()
+    # Drains intents left behind by a previous process
+    from .outbox import outbox
+    outbox.start()
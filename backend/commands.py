@@ -0,0 +1,140 @@
+import time
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from .extensions import create_external_emitter
+from .counters import rebuild_counters
+from .conversations import rebuild_conversations
+from .outbox import outbox
+from .search import search_index
+from .sentiment import sentiment_scorer
+from .startup import profile_imports, measure_startup, project_root
+from .sanitizer import benchmark as benchmark_sanitizer
+from .storage import media_storage
+from .stories import story_sweeper
+
+@click.command('rebuild-counters')
+@with_appcontext
+def rebuild_counters_command():
+    """Rebuild denormalized post, comment and user counters from the source tables."""
+    rebuild_counters()
+    click.echo('Counters rebuilt.')
+
+@click.command('rebuild-conversations')
+@with_appcontext
+def rebuild_conversations_command():
+    """Rebuild the conversation index used by /api/conversations."""
+    rebuild_conversations()
+    click.echo('Conversations rebuilt.')
+
+@click.command('rebuild-search-index')
+@with_appcontext
+def rebuild_search_index_command():
+    """Re-index every user and post for /api/search."""
+    search_index.rebuild()
+    click.echo('Search index rebuilt.')
+
+@click.command('backfill-sentiment')
+@with_appcontext
+def backfill_sentiment_command():
+    """Score every post that has no stored sentiment yet."""
+    scored = sentiment_scorer.backfill()
+    click.echo(f'Scored {scored} posts.')
+
+@click.command('gc-media')
+@click.option('--grace', type=int, default=None, help='Keep unreferenced blobs younger than this many seconds (default: MEDIA_GC_GRACE).')
+@with_appcontext
+def gc_media_command(grace):
+    """Delete stored media that no profile, post, comment, story or message references."""
+    if grace is None:
+        grace = current_app.config['MEDIA_GC_GRACE']
+    deleted, freed = media_storage.collect_garbage(grace)
+    click.echo(f'Deleted {deleted} blobs ({freed / 1024 / 1024:.1f} MB).')
+
+@click.command('sweep-stories')
+@with_appcontext
+def sweep_stories_command():
+    """Delete expired stories now instead of waiting for the background sweeper."""
+    click.echo(f'Deleted {story_sweeper.sweep()} expired stories.')
+
+@click.command('retry-notifications')
+@with_appcontext
+def retry_notifications_command():
+    """Requeue notification intents the outbox gave up on, then deliver them."""
+    count = outbox.retry_failed()
+    outbox.flush()
+    click.echo(f'Requeued {count} notification intents.')
+
+@click.command('check-message-queue')
+@with_appcontext
+def check_message_queue_command():
+    """Round-trip a test emit through the configured Socket.IO message queue."""
+    url = current_app.config['SOCKETIO_MESSAGE_QUEUE']
+    channel = current_app.config['SOCKETIO_CHANNEL']
+    if not url:
+        click.echo('No SOCKETIO_MESSAGE_QUEUE configured; emits only reach this process.')
+        return
+    if not url.startswith('redis'):
+        raise click.ClickException('Only redis:// message queues can be checked.')
+
+    import redis
+    try:
+        pubsub = redis.Redis.from_url(url).pubsub()
+        pubsub.subscribe(channel)
+        create_external_emitter(url, channel).emit('healthcheck', {'ok': True}, room='healthcheck')
+
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            message = pubsub.get_message(timeout=deadline - time.monotonic())
+            if message is not None and message['type'] == 'message':
+                click.echo(f'Message queue OK: {url} (channel {channel!r}).')
+                return
+    except redis.RedisError as error:
+        raise click.ClickException(f'Cannot reach the message queue at {url}: {error}')
+    raise click.ClickException(f'No message seen on channel {channel!r} within 5 seconds.')
+
+@click.command('import-profile')
+@click.option('--top', default=25, show_default=True, help='Number of imports to list.')
+@with_appcontext
+def import_profile_command(top):
+    """List the slowest imports of create_app() (python -X importtime)."""
+    click.echo(f"{'cumulative ms':>14} {'self ms':>8}  module")
+    for cumulative_us, self_us, module in profile_imports(project_root(current_app), top):
+        click.echo(f'{cumulative_us / 1000:>14.1f} {self_us / 1000:>8.1f}  {module}')
+
+@click.command('startup-benchmark')
+@click.option('--runs', default=3, show_default=True, help='Fresh interpreters to time.')
+@click.option('--budget', type=float, default=None, help='Seconds allowed for import + create_app() (default: STARTUP_TIME_BUDGET).')
+@with_appcontext
+def startup_benchmark_command(runs, budget):
+    """Fail if app startup exceeds the time budget or loads heavy libraries eagerly."""
+    budget = budget or current_app.config['STARTUP_TIME_BUDGET']
+    timings, eager = measure_startup(project_root(current_app), runs)
+    median = timings[len(timings) // 2]
+    click.echo(f"create_app(): median {median:.3f}s, best {timings[0]:.3f}s over {runs} runs (budget {budget:.3f}s)")
+    if eager:
+        raise click.ClickException(f"Loaded at startup instead of on first use: {', '.join(eager)}")
+    if median > budget:
+        raise click.ClickException(f'Startup took {median:.3f}s, over the {budget:.3f}s budget.')
+
+@click.command('sanitizer-benchmark')
+@click.option('--iterations', default=2000, show_default=True)
+def sanitizer_benchmark_command(iterations):
+    """Compare HTML sanitizer throughput on message and post sized inputs."""
+    for sample, variants in benchmark_sanitizer(iterations).items():
+        click.echo(sample)
+        for variant, per_second in variants.items():
+            click.echo(f'  {variant:<16} {per_second:>12,.0f} calls/s')
+
+def register_commands(app):
+    app.cli.add_command(rebuild_counters_command)
+    app.cli.add_command(rebuild_conversations_command)
+    app.cli.add_command(rebuild_search_index_command)
+    app.cli.add_command(backfill_sentiment_command)
+    app.cli.add_command(gc_media_command)
+    app.cli.add_command(sweep_stories_command)
+    app.cli.add_command(retry_notifications_command)
+    app.cli.add_command(check_message_queue_command)
+    app.cli.add_command(import_profile_command)
+    app.cli.add_command(startup_benchmark_command)
+    app.cli.add_command(sanitizer_benchmark_command)
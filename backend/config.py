@@ -9,6 +9,83 @@ class Config:
     JWT_SECRET_KEY = os.environ.get('JWT_SECRET_KEY') or 'a-very-secret-jwt-key'
     SQLALCHEMY_DATABASE_URI = os.environ.get('SQLALCHEMY_DATABASE_URI') or 'sqlite:///default.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Socket.IO message queue (e.g. redis://localhost:6379/0), needed to emit across several worker processes
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE')
+    SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'flask-socketio')
     JWT_ACCESS_TOKEN_EXPIRES = timedelta(days=30)
     UPLOAD_FOLDER = 'uploads'
-    MAX_CONTENT_LENGTH = 50 * 1024 * 1024
\ No newline at end of file
+    MAX_CONTENT_LENGTH = 50 * 1024 * 1024
+    # Image variants are rendered in a process pool (see backend/media.py); 0 renders in the request
+    MEDIA_POOL_SIZE = int(os.environ.get('MEDIA_POOL_SIZE', 2))
+    MEDIA_PROCESS_TIMEOUT = 30
+    MEDIA_JPEG_QUALITY = 85
+    # Content-addressed blob store (see backend/storage.py); `flask gc-media` keeps unreferenced blobs this many seconds
+    MEDIA_STORAGE_BACKEND = 'local'
+    MEDIA_GC_GRACE = 24 * 60 * 60
+    MEDIA_MAX_AGE = 365 * 24 * 60 * 60
+    # Content hashes kept for ETags of legacy uploads and static assets (LRU)
+    MEDIA_ETAG_CACHE_SIZE = 10000
+    # Let a front server (nginx X-Accel / Apache X-Sendfile) send files instead of the app
+    USE_X_SENDFILE = os.environ.get('USE_X_SENDFILE', 'false').lower() == 'true'
+
+    # Fan-out-on-write home timeline (see backend/timeline.py)
+    TIMELINE_FANOUT_ENABLED = os.environ.get('TIMELINE_FANOUT_ENABLED', 'false').lower() == 'true'
+    TIMELINE_MAX_LENGTH = 800
+    TIMELINE_FANOUT_MAX_FOLLOWERS = 5000
+    TIMELINE_TRIM_ASYNC = True
+    TIMELINE_TRIM_INTERVAL = 5.0
+    TIMELINE_TRIM_BATCH_SIZE = 200
+
+    # Full-text search backend: 'auto' (FTS5 on SQLite, ILIKE elsewhere), 'fts5' or 'like'
+    SEARCH_BACKEND = os.environ.get('SEARCH_BACKEND', 'auto')
+
+    # In-process typeahead index for /api/search/users/suggest (see backend/typeahead.py); 0 builds it on first use
+    TYPEAHEAD_REFRESH_INTERVAL = 300
+    TYPEAHEAD_CIRCLE_TTL = 60
+    TYPEAHEAD_MAX_CIRCLE = 5000
+    # Followed users whose own follows are expanded into friends-of-friends, and viewers whose circle is cached (LRU)
+    TYPEAHEAD_MAX_EXPANDED = 500
+    TYPEAHEAD_CIRCLE_CACHE_SIZE = 1000
+
+    # Follow graph cache (see backend/graph.py); set GRAPH_CACHE_REDIS_URL to share it between processes
+    GRAPH_CACHE_REDIS_URL = os.environ.get('GRAPH_CACHE_REDIS_URL')
+    GRAPH_CACHE_TTL = 300
+    GRAPH_CACHE_MAX_USERS = 100000
+    GRAPH_SUGGESTION_MAX_FRIENDS = 500
+
+    # Presence (see backend/presence.py); set PRESENCE_REDIS_URL to share it between processes
+    PRESENCE_REDIS_URL = os.environ.get('PRESENCE_REDIS_URL')
+    PRESENCE_TTL = 90
+    PRESENCE_FLUSH_INTERVAL = 30
+
+    # Background sentiment scoring (see backend/sentiment.py); SENTIMENT_POOL_SIZE=0 scores in the worker task itself
+    SENTIMENT_ASYNC = True
+    SENTIMENT_POOL_SIZE = int(os.environ.get('SENTIMENT_POOL_SIZE', 2))
+    SENTIMENT_BATCH_SIZE = 200
+    SENTIMENT_FLUSH_INTERVAL = 1.0
+
+    # Expired story sweeper (see backend/stories.py); 0 disables the background loop
+    STORY_SWEEP_INTERVAL = 300
+    STORY_SWEEP_BATCH_SIZE = 500
+    STORY_VIEWS_ASYNC = True
+    STORY_VIEW_FLUSH_INTERVAL = 1.0
+
+    # Fail any request issuing more SQL statements than this (see backend/query_budget.py); meant for tests
+    MAX_QUERIES_PER_REQUEST = int(os.environ['MAX_QUERIES_PER_REQUEST']) if os.environ.get('MAX_QUERIES_PER_REQUEST') else None
+
+    # Per-endpoint request/SQL metrics (see backend/metrics.py), served at /api/_metrics to requests
+    # sending `Authorization: Bearer <METRICS_TOKEN>`; the endpoint is disabled while METRICS_TOKEN is unset
+    METRICS_ENABLED = True
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+    # Statements slower than this many seconds are logged with their query plan; None disables the slow-query log
+    SLOW_QUERY_THRESHOLD = float(os.environ['SLOW_QUERY_THRESHOLD']) if os.environ.get('SLOW_QUERY_THRESHOLD') else None
+    SLOW_QUERY_LOG_SIZE = 200
+
+    # Worker cold-start budget checked by `flask startup-benchmark` (see backend/startup.py)
+    STARTUP_TIME_BUDGET = float(os.environ.get('STARTUP_TIME_BUDGET', 2.0))
+
+    # Notification outbox (see backend/outbox.py)
+    NOTIFICATION_OUTBOX_ASYNC = True
+    NOTIFICATION_BATCH_SIZE = 500
+    NOTIFICATION_FLUSH_INTERVAL = 0.5
+    NOTIFICATION_MAX_RETRIES = 3
\ No newline at end of file
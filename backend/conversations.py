@@ -0,0 +1,77 @@
+from importlib import import_module
+from sqlalchemy.exc import IntegrityError
+from .extensions import db
+from .models import Conversation, Message
+
+def snippet(content):
+    return content[:50] + '...' if len(content) > 50 else content
+
+def _find(user_id, partner_id):
+    return Conversation.query.filter_by(user_id=user_id, partner_id=partner_id).first()
+
+def _get_or_create(user_id, partner_id):
+    conversation = _find(user_id, partner_id)
+    if conversation is not None:
+        return conversation
+
+    # The first messages of a pair can be sent at the same moment; the unique constraint settles it
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = import_module(f'sqlalchemy.dialects.{dialect}').insert
+        db.session.execute(insert(Conversation).values(
+            user_id=user_id, partner_id=partner_id, unread_count=0
+        ).on_conflict_do_nothing(index_elements=['user_id', 'partner_id']))
+    else:
+        try:
+            with db.session.begin_nested():
+                db.session.add(Conversation(user_id=user_id, partner_id=partner_id, unread_count=0))
+        except IntegrityError:
+            pass
+    return _find(user_id, partner_id)
+
+def record_message(message):
+    """Updates both participants' conversation rows for a new message, in the current transaction."""
+    for user_id, partner_id in ((message.sender_id, message.receiver_id), (message.receiver_id, message.sender_id)):
+        conversation = _get_or_create(user_id, partner_id)
+        conversation.last_message_id = message.id
+        conversation.last_message_snippet = snippet(message.content)
+        conversation.last_message_at = message.created_at
+        conversation.last_sender_id = message.sender_id
+        if user_id == message.receiver_id:
+            conversation.unread_count = Conversation.unread_count + 1
+
+def mark_conversation_read(user_id, partner_id):
+    """
+    Marks partner_id's messages to user_id as read. Returns False without
+    writing anything when the conversation index says nothing is unread.
+    """
+    conversation = Conversation.query.filter_by(user_id=user_id, partner_id=partner_id).first()
+    if conversation is not None and conversation.unread_count == 0:
+        return False
+
+    Message.query.filter_by(sender_id=partner_id, receiver_id=user_id, is_read=False).update({'is_read': True})
+    if conversation is not None:
+        conversation.unread_count = 0
+    return True
+
+def rebuild_conversations():
+    """Rebuilds every conversation row from the message table."""
+    Conversation.query.delete()
+
+    conversations = {}
+    for message in Message.query.order_by(Message.id).yield_per(1000):
+        for user_id, partner_id in ((message.sender_id, message.receiver_id), (message.receiver_id, message.sender_id)):
+            conversation = conversations.get((user_id, partner_id))
+            if conversation is None:
+                conversation = conversations[(user_id, partner_id)] = Conversation(
+                    user_id=user_id, partner_id=partner_id, unread_count=0
+                )
+            conversation.last_message_id = message.id
+            conversation.last_message_snippet = snippet(message.content)
+            conversation.last_message_at = message.created_at
+            conversation.last_sender_id = message.sender_id
+            if user_id == message.receiver_id and not message.is_read:
+                conversation.unread_count += 1
+
+    db.session.add_all(conversations.values())
+    db.session.commit()
@@ -0,0 +1,63 @@
+from .extensions import db
+from .models import Post, Comment, Like, CommentLike, Share, User, Notification, followers
+
+REACTION_TYPES = ['like', 'love', 'haha', 'wow', 'sad', 'angry']
+
+def _increment(model, row_id, deltas):
+    values = {getattr(model, name): getattr(model, name) + delta for name, delta in deltas.items() if delta}
+    if values:
+        model.query.filter_by(id=row_id).update(values, synchronize_session=False)
+
+def update_post_counters(post_id, **deltas):
+    """Atomically adjusts Post counters in the current transaction, e.g. shares_count=1."""
+    _increment(Post, post_id, deltas)
+
+def update_comment_counters(comment_id, **deltas):
+    """Atomically adjusts Comment counters in the current transaction, e.g. likes_count=-1."""
+    _increment(Comment, comment_id, deltas)
+
+def update_user_counters(user_id, **deltas):
+    """Atomically adjusts User counters in the current transaction, e.g. unread_notifications_count=3."""
+    _increment(User, user_id, deltas)
+
+def record_reaction(post_id, added=None, removed=None):
+    """Applies a reaction being added, removed or changed (both set) to the Post counters."""
+    deltas = {'likes_count': (added is not None) - (removed is not None)}
+    if added in REACTION_TYPES:
+        deltas[f'reaction_{added}'] = deltas.get(f'reaction_{added}', 0) + 1
+    if removed in REACTION_TYPES:
+        deltas[f'reaction_{removed}'] = deltas.get(f'reaction_{removed}', 0) - 1
+    update_post_counters(post_id, **deltas)
+
+def reaction_counts(post):
+    return {reaction_type: getattr(post, f'reaction_{reaction_type}') or 0 for reaction_type in REACTION_TYPES}
+
+def _count(model, *criteria):
+    return db.select(db.func.count(model.id)).where(*criteria).scalar_subquery()
+
+def rebuild_counters():
+    """Recomputes every denormalized counter from the source tables, repairing any drift."""
+    post_values = {
+        Post.likes_count: _count(Like, Like.post_id == Post.id),
+        Post.comments_count: _count(Comment, Comment.post_id == Post.id),
+        Post.shares_count: _count(Share, Share.post_id == Post.id)
+    }
+    for reaction_type in REACTION_TYPES:
+        post_values[getattr(Post, f'reaction_{reaction_type}')] = _count(
+            Like, Like.post_id == Post.id, Like.reaction_type == reaction_type
+        )
+    db.session.execute(db.update(Post).values(post_values))
+
+    replies = db.aliased(Comment)
+    db.session.execute(db.update(Comment).values({
+        Comment.likes_count: _count(CommentLike, CommentLike.comment_id == Comment.id),
+        Comment.replies_count: db.select(db.func.count(replies.id)).where(replies.parent_id == Comment.id).scalar_subquery()
+    }))
+
+    db.session.execute(db.update(User).values({
+        User.unread_notifications_count: _count(Notification, Notification.user_id == User.id, Notification.is_read == False),
+        User.followers_count: db.select(db.func.count()).select_from(followers).where(followers.c.followed_id == User.id).scalar_subquery(),
+        User.following_count: db.select(db.func.count()).select_from(followers).where(followers.c.follower_id == User.id).scalar_subquery(),
+        User.posts_count: _count(Post, Post.user_id == User.id)
+    }))
+    db.session.commit()
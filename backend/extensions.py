@@ -9,4 +9,12 @@ db = SQLAlchemy()
 jwt = JWTManager()
 socketio = SocketIO(cors_allowed_origins="*")
 limiter = Limiter(key_func=get_remote_address, default_limits=["200 per day", "50 per hour"])
-cors = CORS()
\ No newline at end of file
+cors = CORS()
+
+def create_external_emitter(message_queue, channel='flask-socketio'):
+    """
+    Write-only SocketIO for processes that are not web workers (cron jobs,
+    out-of-band workers). Emits go through the message queue and reach
+    clients connected to any worker.
+    """
+    return SocketIO(message_queue=message_queue, channel=channel)
\ No newline at end of file
@@ -0,0 +1,45 @@
+from .extensions import db
+from .models import Like
+from .counters import reaction_counts
+
+def serialize_author(user):
+    return {
+        'id': user.id,
+        'username': user.username,
+        'first_name': user.first_name,
+        'last_name': user.last_name,
+        'profile_picture': user.profile_picture,
+        'is_verified': user.is_verified
+    }
+
+def hydrate_posts(posts, viewer_id=None):
+    """
+    Loads the viewer's own reactions for a page of posts in one query.
+    Authors should be eager-loaded by the caller with Post.with_author(),
+    and counts come from the denormalized Post counters.
+    Returns a dict of post_id -> hydrated fields.
+    """
+    post_ids = [p.id for p in posts]
+    if not post_ids:
+        return {}
+
+    viewer_reactions = {}
+    if viewer_id is not None:
+        viewer_reactions = dict(db.session.query(Like.post_id, Like.reaction_type).filter(
+            Like.user_id == viewer_id,
+            Like.post_id.in_(post_ids)
+        ).all())
+
+    hydrated = {}
+    for post in posts:
+        hydrated[post.id] = {
+            'author': serialize_author(post.author),
+            'likes_count': post.likes_count,
+            'comments_count': post.comments_count,
+            'shares_count': post.shares_count,
+            'user_liked': post.id in viewer_reactions,
+            'user_reaction': viewer_reactions.get(post.id),
+            'reactions': reaction_counts(post)
+        }
+
+    return hydrated
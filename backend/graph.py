@@ -0,0 +1,271 @@
+import time
+from array import array
+from bisect import bisect_left
+from collections import Counter, OrderedDict
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+from .extensions import db
+from .models import User, Friendship, followers
+from .counters import update_user_counters
+
+def _edge_exists(follower_id, followed_id):
+    # Primary key lookup on (follower_id, followed_id); writes check the table, not the cache
+    return db.session.execute(db.select(followers.c.follower_id).where(
+        followers.c.follower_id == follower_id,
+        followers.c.followed_id == followed_id
+    )).first() is not None
+
+def follow(follower_id, followed_id):
+    """Adds a follow edge and bumps both cached counts. Returns False if it already existed."""
+    if _edge_exists(follower_id, followed_id):
+        return False
+    db.session.execute(followers.insert().values(follower_id=follower_id, followed_id=followed_id))
+    update_user_counters(follower_id, following_count=1)
+    update_user_counters(followed_id, followers_count=1)
+    graph_cache.invalidate_on_commit(follower_id)
+    return True
+
+def unfollow(follower_id, followed_id):
+    """Removes a follow edge and its counts. Returns False if there was none."""
+    removed = db.session.execute(followers.delete().where(
+        followers.c.follower_id == follower_id,
+        followers.c.followed_id == followed_id
+    )).rowcount
+    if not removed:
+        return False
+    update_user_counters(follower_id, following_count=-1)
+    update_user_counters(followed_id, followers_count=-1)
+    graph_cache.invalidate_on_commit(follower_id)
+    return True
+
+def is_following(follower_id, followed_id):
+    return graph_cache.is_following(follower_id, followed_id)
+
+def mutual_following_query(user_id, other_id):
+    """Ids both users follow: one join of their followers rows on followed_id."""
+    theirs = db.aliased(followers)
+    return db.select(followers.c.followed_id).join(
+        theirs, theirs.c.followed_id == followers.c.followed_id
+    ).where(
+        followers.c.follower_id == user_id,
+        theirs.c.follower_id == other_id
+    )
+
+def mutual_count(user_id, other_id):
+    return db.session.scalar(db.select(db.func.count()).select_from(mutual_following_query(user_id, other_id).subquery()))
+
+def mutual_sample(user_id, other_id, limit=3):
+    return User.query.filter(User.id.in_(mutual_following_query(user_id, other_id))).order_by(User.id).limit(limit).all()
+
+def mutual_users_query(user_id, other_id):
+    """User query for paginating the full mutual list."""
+    return User.query.filter(User.id.in_(mutual_following_query(user_id, other_id)))
+
+class MemoryGraphStore:
+    """Per-process LRU of adjacency arrays. The TTL bounds staleness from follows made in other processes."""
+
+    def __init__(self, max_users, ttl):
+        self._arrays = OrderedDict()
+        self._max_users = max_users
+        self._ttl = ttl
+
+    def get_many(self, user_ids):
+        now = time.monotonic()
+        found = {}
+        for user_id in user_ids:
+            cached = self._arrays.get(user_id)
+            if cached is not None and cached[0] > now:
+                self._arrays.move_to_end(user_id)
+                found[user_id] = cached[1]
+        return found
+
+    def set_many(self, arrays):
+        expires_at = time.monotonic() + self._ttl
+        for user_id, adjacency in arrays.items():
+            self._arrays[user_id] = (expires_at, adjacency)
+            self._arrays.move_to_end(user_id)
+        while len(self._arrays) > self._max_users:
+            self._arrays.popitem(last=False)
+
+    def delete(self, user_ids):
+        for user_id in user_ids:
+            self._arrays.pop(user_id, None)
+
+class RedisGraphStore:
+    """Shares adjacency arrays between processes as packed int32 strings with a TTL."""
+
+    def __init__(self, url, ttl, prefix='graph:following:'):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._ttl = ttl
+        self._prefix = prefix
+
+    def get_many(self, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        found = {}
+        for user_id, packed in zip(user_ids, self._redis.mget([f'{self._prefix}{user_id}' for user_id in user_ids])):
+            if packed is not None:
+                adjacency = array('i')
+                adjacency.frombytes(packed)
+                found[user_id] = adjacency
+        return found
+
+    def set_many(self, arrays):
+        pipeline = self._redis.pipeline()
+        for user_id, adjacency in arrays.items():
+            pipeline.set(f'{self._prefix}{user_id}', adjacency.tobytes(), ex=self._ttl)
+        pipeline.execute()
+
+    def delete(self, user_ids):
+        if user_ids:
+            self._redis.delete(*[f'{self._prefix}{user_id}' for user_id in user_ids])
+
+class FollowGraphCache:
+    """
+    Caches who each user follows as a sorted array('i') of user ids, so
+    follow checks are a bisect and friends-of-friends walks need no per-user
+    queries. follow()/unfollow() above invalidate the follower's entry.
+    Set GRAPH_CACHE_REDIS_URL to share the cache between processes.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.store = None
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        if app.config['GRAPH_CACHE_REDIS_URL']:
+            self.store = RedisGraphStore(app.config['GRAPH_CACHE_REDIS_URL'], app.config['GRAPH_CACHE_TTL'])
+        else:
+            self.store = MemoryGraphStore(app.config['GRAPH_CACHE_MAX_USERS'], app.config['GRAPH_CACHE_TTL'])
+        app.extensions['graph_cache'] = self
+
+        for name in ('after_commit', 'after_rollback'):
+            if not event.contains(Session, name, _flush_graph_invalidations):
+                event.listen(Session, name, _flush_graph_invalidations)
+
+    def following_many(self, user_ids):
+        """Returns {user_id: sorted array of followed ids}, loading every miss in one query."""
+        user_ids = set(user_ids)
+        found = self.store.get_many(user_ids)
+        missing = user_ids - found.keys()
+        self.hits += len(found)
+        self.misses += len(missing)
+
+        if missing:
+            loaded = {user_id: [] for user_id in missing}
+            for follower_id, followed_id in db.session.execute(
+                db.select(followers.c.follower_id, followers.c.followed_id).where(followers.c.follower_id.in_(missing))
+            ):
+                loaded[follower_id].append(followed_id)
+            arrays = {user_id: array('i', sorted(ids)) for user_id, ids in loaded.items()}
+            self.store.set_many(arrays)
+            found.update(arrays)
+        return found
+
+    def following(self, user_id):
+        return self.following_many([user_id])[user_id]
+
+    def is_following(self, follower_id, followed_id):
+        adjacency = self.following(follower_id)
+        position = bisect_left(adjacency, followed_id)
+        return position < len(adjacency) and adjacency[position] == followed_id
+
+    def invalidate(self, *user_ids):
+        self.invalidations += len(user_ids)
+        self.store.delete(user_ids)
+
+    def invalidate_on_commit(self, user_id):
+        """
+        Drops a user's entry now and again once the transaction ends, since a
+        concurrent read may re-fill it from the old edges before the commit.
+        """
+        self.invalidate(user_id)
+        db.session.info.setdefault('graph_invalidations', set()).add(user_id)
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'invalidations': self.invalidations,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else None
+        }
+
+    def suggestions(self, user_id, limit=10):
+        """
+        People you may know: users followed by the people `user_id` follows,
+        ranked by how many of them follow each one. Returns [(user_id, mutual_count)].
+        """
+        following = self.following(user_id)
+        friends = following[:self.app.config['GRAPH_SUGGESTION_MAX_FRIENDS']]
+        excluded = set(following)
+        excluded.add(user_id)
+
+        scores = Counter()
+        for adjacency in self.following_many(friends).values():
+            scores.update(candidate for candidate in adjacency if candidate not in excluded)
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+graph_cache = FollowGraphCache()
+
+def _flush_graph_invalidations(session):
+    user_ids = session.info.pop('graph_invalidations', None)
+    if user_ids:
+        graph_cache.invalidate(*user_ids)
+
+def friendship_between(user_id, other_id):
+    """The Friendship row for a pair of users in either direction, via the (pair_low, pair_high) unique index."""
+    low, high = sorted((user_id, other_id))
+    return Friendship.query.filter_by(pair_low=low, pair_high=high).first()
+
+def relationships(viewer_id, user_ids):
+    """
+    Friend, pending-request and follow state between the viewer and a batch
+    of users, fetched in one UNION ALL round trip. Returns {user_id: state}.
+    """
+    user_ids = set(user_ids) - {viewer_id}
+    state = {user_id: {
+        'is_friend': False,
+        'request': None,
+        'friendship_id': None,
+        'is_following': False,
+        'follows_you': False
+    } for user_id in user_ids}
+    if not user_ids:
+        return state
+
+    other = db.case((Friendship.pair_low == viewer_id, Friendship.pair_high), else_=Friendship.pair_low)
+    rows = db.session.execute(db.union_all(
+        db.select(db.literal('friendship').label('kind'), other.label('user_id'), Friendship.id.label('friendship_id'),
+                  Friendship.status, Friendship.user_id.label('sender_id')).where(
+            ((Friendship.pair_low == viewer_id) & Friendship.pair_high.in_(user_ids)) |
+            ((Friendship.pair_high == viewer_id) & Friendship.pair_low.in_(user_ids))
+        ),
+        db.select(db.literal('following'), followers.c.followed_id, db.null(), db.null(), db.null()).where(
+            followers.c.follower_id == viewer_id, followers.c.followed_id.in_(user_ids)
+        ),
+        db.select(db.literal('followed_by'), followers.c.follower_id, db.null(), db.null(), db.null()).where(
+            followers.c.followed_id == viewer_id, followers.c.follower_id.in_(user_ids)
+        )
+    ))
+
+    for kind, user_id, friendship_id, status, sender_id in rows:
+        if kind == 'following':
+            state[user_id]['is_following'] = True
+        elif kind == 'followed_by':
+            state[user_id]['follows_you'] = True
+        else:
+            state[user_id]['friendship_id'] = friendship_id
+            if status == 'accepted':
+                state[user_id]['is_friend'] = True
+            else:
+                state[user_id]['request'] = 'sent' if sender_id == viewer_id else 'received'
+    return state
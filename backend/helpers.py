@@ -1,37 +1,17 @@
-import bleach
-from .extensions import db, socketio
-from .models import Notification, User, Post, Like
+from .models import Post
+from .timeline import fanout_enabled, timeline_page, timeline_query
+from .pagination import paginate
+from .outbox import outbox
+from .sanitizer import sanitize
 
 def sanitize_content(content):
-    allowed_tags = ['p', 'br', 'strong', 'em', 'u', 'a', 'ul', 'ol', 'li']
-    allowed_attributes = {'a': ['href', 'title']}
-    return bleach.clean(content, tags=allowed_tags, attributes=allowed_attributes, strip=True)
+    return sanitize(content)
 
 def create_notification(user_id, sender_id, ntype, content, link=None):
-    notification = Notification(
-        user_id=user_id,
-        sender_id=sender_id,
-        type=ntype,
-        content=content,
-        link=link
-    )
-    db.session.add(notification)
-    db.session.commit()
-    
-    sender = User.query.get(sender_id)
-    socketio.emit('new_notification', {
-        'id': notification.id,
-        'type': ntype,
-        'content': content,
-        'sender': sender.username if sender else None,
-        'created_at': notification.created_at.isoformat()
-    }, room=f'user_{user_id}')
+    # Joins the caller's transaction; written and emitted in bulk by the outbox flusher after the commit
+    outbox.enqueue(user_id, sender_id, ntype, content, link)
 
-def get_user_feed(user_id, page=1, per_page=10):
-    user = User.query.get(user_id)
-    friends = [f.id for f in user.following.all()]
-    friends.append(user_id)
-    
-    posts = Post.query.filter(Post.user_id.in_(friends)).order_by(Post.created_at.desc()).paginate(page=page, per_page=per_page, error_out=False)
-    
-    return posts
\ No newline at end of file
+def get_user_feed(user_id, **pagination):
+    if fanout_enabled():
+        return timeline_page(user_id, **pagination)
+    return paginate(timeline_query(user_id).options(Post.with_author()), Post, **pagination)
\ No newline at end of file
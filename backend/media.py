@@ -0,0 +1,168 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from flask import request, jsonify
+from .extensions import socketio
+from .storage import media_storage
+
+ALLOWED_IMAGE_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'webp'}
+CHUNK_SIZE = 64 * 1024
+
+# Re-encoded variants per upload kind. 'crop' fills the box exactly, 'fit'
+# scales down to fit inside it (None = unbounded) and never scales up.
+# The primary variant is the one stored on the model.
+MEDIA_VARIANTS = {
+    'avatar': {'primary': '128', 'sizes': {
+        '64': ('crop', 64, 64), '128': ('crop', 128, 128), '512': ('crop', 512, 512)
+    }},
+    'cover': {'primary': '820', 'sizes': {
+        '820': ('crop', 820, 312), '1640': ('crop', 1640, 624)
+    }},
+    'post': {'primary': '1280', 'sizes': {
+        '320': ('fit', 320, None), '640': ('fit', 640, None), '1280': ('fit', 1280, None)
+    }},
+    'story': {'primary': '1080', 'sizes': {
+        '1080': ('fit', 1080, 1920), 'thumb': ('crop', 180, 320)
+    }}
+}
+
+class InvalidImage(ValueError):
+    pass
+
+class MediaProcessingTimeout(Exception):
+    pass
+
+def _decode(source_path, largest):
+    from PIL import Image, UnidentifiedImageError
+
+    # Only failures to read the upload are the client's fault; anything later is ours
+    try:
+        image = Image.open(source_path)
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise InvalidImage('The file is not a valid image')
+    try:
+        # Let the JPEG decoder downscale while decoding when the variants are much smaller
+        image.draft('RGB', (largest, largest))
+        image.load()
+    except (Image.DecompressionBombError, OSError):
+        image.close()
+        raise InvalidImage('The file is not a valid image')
+    return image
+
+def render_variants(source_path, kind, output_dir, basename, quality=85):
+    """
+    Decodes one upload and writes its size-bounded JPEG variants. Runs in a
+    pool process; returns {variant: filename}. Only decode errors raise
+    InvalidImage; failing to write a variant raises as is.
+    """
+    from PIL import Image, ImageOps
+
+    sizes = MEDIA_VARIANTS[kind]['sizes']
+    with _decode(source_path, max(width for _, width, _ in sizes.values())) as image:
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGBA') if 'A' in image.getbands() or 'transparency' in image.info else image.convert('RGB')
+            if image.mode == 'RGBA':
+                background = Image.new('RGB', image.size, (255, 255, 255))
+                background.paste(image, mask=image.getchannel('A'))
+                image = background
+
+        filenames = {}
+        for name, (mode, width, height) in sizes.items():
+            if mode == 'crop':
+                variant = ImageOps.fit(image, (width, height), Image.Resampling.LANCZOS)
+            else:
+                variant = image.copy()
+                variant.thumbnail((width, height or image.height), Image.Resampling.LANCZOS)
+            filename = f'{basename}_{name}.jpg'
+            variant.save(os.path.join(output_dir, filename), 'JPEG', quality=quality, optimize=True, progressive=True)
+            filenames[name] = filename
+        return filenames
+
+class MediaPipeline:
+    """
+    Turns uploaded images into re-encoded, size-bounded variants (see
+    MEDIA_VARIANTS). The upload is streamed to a temporary file and hashed on
+    the way; content already in the blob store is not decoded again. New
+    content is decoded in a pool of MEDIA_POOL_SIZE processes (0 decodes
+    in-process), so large originals are never held in memory or served.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._executor = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['media_pipeline'] = self
+
+    def _folder(self, *parts):
+        return os.path.join(self.app.config['UPLOAD_FOLDER'], *parts)
+
+    def _render(self, *args):
+        pool_size = self.app.config['MEDIA_POOL_SIZE']
+        if not pool_size:
+            return render_variants(*args)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=pool_size)
+
+        future = self._executor.submit(render_variants, *args)
+        deadline = time.monotonic() + self.app.config['MEDIA_PROCESS_TIMEOUT']
+        # Poll instead of blocking so other green threads keep running meanwhile
+        while not future.done():
+            if time.monotonic() > deadline:
+                future.cancel()
+                raise MediaProcessingTimeout('Image processing timed out, please try again')
+            socketio.sleep(0.01)
+        return future.result()
+
+    def process_upload(self, file, kind):
+        """Stores the variants of an uploaded FileStorage; returns (primary_url, {variant: url})."""
+        extension = file.filename.rsplit('.', 1)[-1].lower() if '.' in file.filename else ''
+        if extension not in ALLOWED_IMAGE_EXTENSIONS:
+            raise InvalidImage('Only JPEG, PNG, GIF and WebP images are supported')
+
+        sizes = MEDIA_VARIANTS[kind]['sizes']
+        digest = hashlib.sha256()
+        handle, temp_path = tempfile.mkstemp(dir=self._folder('tmp'))
+        try:
+            with os.fdopen(handle, 'wb') as temp_file:
+                for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    temp_file.write(chunk)
+
+            key = f'{digest.hexdigest()}-{kind}'
+            if not media_storage.has(key, sizes):
+                render_dir = tempfile.mkdtemp(dir=self._folder('tmp'))
+                try:
+                    filenames = self._render(temp_path, kind, render_dir, key, self.app.config['MEDIA_JPEG_QUALITY'])
+                    media_storage.store(key, {name: os.path.join(render_dir, filename) for name, filename in filenames.items()})
+                finally:
+                    shutil.rmtree(render_dir, ignore_errors=True)
+        finally:
+            os.remove(temp_path)
+
+        variants = media_storage.urls(key, sizes)
+        return variants[MEDIA_VARIANTS[kind]['primary']], variants
+
+media_pipeline = MediaPipeline()
+
+def upload_from_request(kind):
+    """Processes the 'file' field of the current multipart request."""
+    file = request.files.get('file')
+    if file is None:
+        raise InvalidImage('No file uploaded')
+    if file.filename == '':
+        raise InvalidImage('No file selected')
+    return media_pipeline.process_upload(file, kind)
+
+def handle_invalid_image(error):
+    return jsonify({'message': str(error)}), 400
+
+def handle_processing_timeout(error):
+    return jsonify({'message': str(error)}), 503
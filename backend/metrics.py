@@ -0,0 +1,223 @@
+import hashlib
+import hmac
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict, defaultdict
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from .extensions import db
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+_STRING_RE = re.compile(r"'(?:[^']|'')*'")
+_NUMBER_RE = re.compile(r'\b\d+(?:\.\d+)?\b')
+_PARAM_LIST_RE = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE_RE = re.compile(r'\s+')
+
+def fingerprint(statement):
+    """Statement with literals and IN-list lengths normalized, so every call site groups under one key."""
+    statement = _STRING_RE.sub('?', statement)
+    statement = _NUMBER_RE.sub('?', statement)
+    statement = re.sub(r'%\(\w+\)s|%s|:\w+', '?', statement)
+    statement = _PARAM_LIST_RE.sub('(?, ...)', statement)
+    return _SPACE_RE.sub(' ', statement).strip()
+
+def _explain(conn, statement, parameters):
+    """Query plan for a SELECT, run on a bare DBAPI cursor so it is neither counted nor timed."""
+    prefix = {'sqlite': 'EXPLAIN QUERY PLAN ', 'postgresql': 'EXPLAIN '}.get(conn.dialect.name)
+    if prefix is None or not statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+        return None
+    cursor = conn.connection.cursor()
+    try:
+        cursor.execute(prefix + statement, parameters)
+        return '\n'.join(' '.join(str(column) for column in row) for row in cursor.fetchall())
+    except Exception:
+        return None
+    finally:
+        cursor.close()
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _labels(**labels):
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in labels.items()) + '}'
+
+class RequestMetrics:
+    """
+    Per-endpoint request metrics fed by SQLAlchemy engine events and Flask
+    request hooks: request count, latency histogram, SQL statement count,
+    time spent in the database and response bytes. render() formats them
+    for Prometheus, served at /api/_metrics when METRICS_TOKEN is set.
+
+    Statements slower than SLOW_QUERY_THRESHOLD seconds are logged and kept,
+    grouped by fingerprint, with their EXPLAIN QUERY PLAN output.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._endpoints = defaultdict(lambda: {
+            'requests': 0,
+            'latency_sum': 0.0,
+            'latency_buckets': [0] * len(LATENCY_BUCKETS),
+            'queries': 0,
+            'db_seconds': 0.0,
+            'response_bytes': 0
+        })
+        self._slow_queries = OrderedDict()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['request_metrics'] = self
+        if not app.config['METRICS_ENABLED']:
+            return
+
+        with app.app_context():
+            if not event.contains(db.engine, 'before_cursor_execute', self._before_cursor_execute):
+                event.listen(db.engine, 'before_cursor_execute', self._before_cursor_execute)
+                event.listen(db.engine, 'after_cursor_execute', self._after_cursor_execute)
+                event.listen(db.engine, 'handle_error', self._handle_error)
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+
+    def _before_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+    def _after_cursor_execute(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info['query_start'].pop()
+        # Background flushes run in their own app context, outside any request
+        if has_request_context():
+            g.metrics_queries = g.get('metrics_queries', 0) + 1
+            g.metrics_db_seconds = g.get('metrics_db_seconds', 0.0) + elapsed
+
+        threshold = self.app.config['SLOW_QUERY_THRESHOLD']
+        if threshold is not None and elapsed >= threshold:
+            self._record_slow_query(conn, statement, None if executemany else parameters, elapsed)
+
+    def _handle_error(self, context):
+        # A failed statement never reaches after_cursor_execute
+        if context.connection is not None and context.connection.info.get('query_start'):
+            context.connection.info['query_start'].pop()
+
+    def _record_slow_query(self, conn, statement, parameters, elapsed):
+        key = fingerprint(statement)
+        with self._lock:
+            known = key in self._slow_queries
+        # EXPLAIN runs outside the lock; a concurrent first sighting just computes the plan twice
+        plan = None if known or parameters is None else _explain(conn, statement, parameters)
+
+        with self._lock:
+            entry = self._slow_queries.pop(key, None)
+            first = entry is None
+            if first:
+                entry = {
+                    'fingerprint': key,
+                    'id': hashlib.sha1(key.encode()).hexdigest()[:12],
+                    'count': 0,
+                    'total_seconds': 0.0,
+                    'max_seconds': 0.0,
+                    'plan': plan
+                }
+            entry['count'] += 1
+            entry['total_seconds'] += elapsed
+            entry['max_seconds'] = max(entry['max_seconds'], elapsed)
+            entry['endpoint'] = request.endpoint if has_request_context() else None
+            self._slow_queries[key] = entry
+            while len(self._slow_queries) > self.app.config['SLOW_QUERY_LOG_SIZE']:
+                self._slow_queries.popitem(last=False)
+
+        if first:
+            logger.warning('Slow query (%.3fs) [%s]: %s\n%s', elapsed, entry['id'], key, entry['plan'] or '')
+
+    def _start_request(self):
+        # g outlives the request when an app context was already pushed (tests, CLI)
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_db_seconds = 0.0
+
+    def _finish_request(self, response):
+        latency = time.perf_counter() - g.get('metrics_started', time.perf_counter())
+        key = (request.endpoint or '<unmatched>', request.method, response.status_code)
+        with self._lock:
+            stats = self._endpoints[key]
+            stats['requests'] += 1
+            stats['latency_sum'] += latency
+            position = bisect_left(LATENCY_BUCKETS, latency)
+            if position < len(LATENCY_BUCKETS):
+                stats['latency_buckets'][position] += 1
+            stats['queries'] += g.get('metrics_queries', 0)
+            stats['db_seconds'] += g.get('metrics_db_seconds', 0.0)
+            stats['response_bytes'] += response.content_length or 0
+        return response
+
+    def authorized(self):
+        """True if the request carries METRICS_TOKEN as a bearer token."""
+        token = self.app.config['METRICS_TOKEN']
+        supplied = request.headers.get('Authorization', '')
+        return bool(token) and hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode())
+
+    def slow_queries(self):
+        """Slow statements, slowest in total first."""
+        with self._lock:
+            entries = [dict(entry) for entry in self._slow_queries.values()]
+        return sorted(entries, key=lambda entry: -entry['total_seconds'])
+
+    def render(self, extra=None):
+        """
+        Prometheus text exposition of the endpoint metrics. `extra` maps a
+        metric name to (type, help, value) for gauges and counters owned by
+        other components, such as the follow-graph cache.
+        """
+        with self._lock:
+            endpoints = {key: dict(stats, latency_buckets=list(stats['latency_buckets'])) for key, stats in self._endpoints.items()}
+            slow = [(entry['id'], entry['count'], entry['total_seconds']) for entry in self._slow_queries.values()]
+
+        lines = []
+        def metric(name, kind, help_text, samples):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            lines.extend(f'{name}{labels} {value}' for labels, value in samples)
+
+        def per_endpoint(field):
+            return [(_labels(endpoint=endpoint, method=method, status=status), stats[field])
+                    for (endpoint, method, status), stats in sorted(endpoints.items())]
+
+        metric('faceconnect_http_requests_total', 'counter', 'Requests handled.', per_endpoint('requests'))
+
+        name = 'faceconnect_http_request_duration_seconds'
+        lines.append(f'# HELP {name} Time from the first request hook to the response.')
+        lines.append(f'# TYPE {name} histogram')
+        for (endpoint, method, status), stats in sorted(endpoints.items()):
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS + ('+Inf',), stats['latency_buckets'] + [0]):
+                cumulative += count
+                if bound == '+Inf':
+                    cumulative = stats['requests']
+                lines.append(f'{name}_bucket{_labels(endpoint=endpoint, method=method, status=status, le=bound)} {cumulative}')
+            labels = _labels(endpoint=endpoint, method=method, status=status)
+            lines.append(f"{name}_sum{labels} {round(stats['latency_sum'], 6)}")
+            lines.append(f"{name}_count{labels} {stats['requests']}")
+
+        metric('faceconnect_db_queries_total', 'counter', 'SQL statements issued while handling requests.', per_endpoint('queries'))
+        metric('faceconnect_db_seconds_total', 'counter', 'Time spent executing SQL while handling requests.',
+               [(labels, round(value, 6)) for labels, value in per_endpoint('db_seconds')])
+        metric('faceconnect_http_response_bytes_total', 'counter', 'Response body bytes sent (when the length is known).',
+               per_endpoint('response_bytes'))
+        metric('faceconnect_slow_queries_total', 'counter', 'Statements slower than SLOW_QUERY_THRESHOLD, by fingerprint id.',
+               [(_labels(fingerprint=fingerprint_id), count) for fingerprint_id, count, _ in slow])
+        metric('faceconnect_slow_query_seconds_total', 'counter', 'Time spent in slow statements, by fingerprint id.',
+               [(_labels(fingerprint=fingerprint_id), round(seconds, 6)) for fingerprint_id, _, seconds in slow])
+
+        for name, (kind, help_text, value) in (extra or {}).items():
+            if value is not None:
+                metric(name, kind, help_text, [('', value)])
+        return '\n'.join(lines) + '\n'
+
+request_metrics = RequestMetrics()
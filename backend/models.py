@@ -1,7 +1,6 @@
 from .extensions import db
 from datetime import datetime, timedelta
 from werkzeug.security import generate_password_hash, check_password_hash
-from textblob import TextBlob
 
 # This file is a direct copy-paste of all your classes:
 # followers, User, Friendship, Post, Comment, CommentLike, 
@@ -13,7 +12,8 @@ from textblob import TextBlob
 followers = db.Table('followers',
     db.Column('follower_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
     db.Column('followed_id', db.Integer, db.ForeignKey('user.id'), primary_key=True),
-    db.Column('created_at', db.DateTime, default=datetime.utcnow)
+    db.Column('created_at', db.DateTime, default=datetime.utcnow),
+    db.Index('ix_followers_followed_id', 'followed_id')
 )
 
 class User(db.Model):
@@ -39,6 +39,10 @@ class User(db.Model):
     privacy_settings = db.Column(db.JSON, default={'profile': 'public', 'posts': 'friends', 'friends_list': 'friends'})
     notification_settings = db.Column(db.JSON, default={'likes': True, 'comments': True, 'friend_requests': True, 'messages': True})
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    unread_notifications_count = db.Column(db.Integer, default=0, nullable=False)
+    followers_count = db.Column(db.Integer, default=0, nullable=False)
+    following_count = db.Column(db.Integer, default=0, nullable=False)
+    posts_count = db.Column(db.Integer, default=0, nullable=False)
     
     posts = db.relationship('Post', backref='author', lazy='dynamic', cascade='all, delete-orphan')
     comments = db.relationship('Comment', backref='author', lazy='dynamic', cascade='all, delete-orphan')
@@ -52,16 +56,18 @@ class User(db.Model):
         secondaryjoin=(followers.c.followed_id == id),
         backref=db.backref('followers', lazy='dynamic'), lazy='dynamic')
     
+    # Follow edges go through backend/graph.py, which also keeps the cached counts
     def follow(self, user):
-        if not self.is_following(user):
-            self.following.append(user)
+        from .graph import follow
+        follow(self.id, user.id)
     
     def unfollow(self, user):
-        if self.is_following(user):
-            self.following.remove(user)
+        from .graph import unfollow
+        unfollow(self.id, user.id)
     
     def is_following(self, user):
-        return self.following.filter(followers.c.followed_id == user.id).count() > 0
+        from .graph import is_following
+        return is_following(self.id, user.id)
 
 # --- PASTE ALL OTHER MODELS HERE ---
 # (Friendship, Post, Comment, CommentLike, Like, Share, Story, 
@@ -77,9 +83,26 @@ class Friendship(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     friend_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
     status = db.Column(db.String(20), default='pending', index=True)
+    # Canonical (min, max) user pair: one row per pair whichever side sent the request
+    pair_low = db.Column(db.Integer, nullable=False)
+    pair_high = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     user = db.relationship('User', foreign_keys=[user_id])
     friend = db.relationship('User', foreign_keys=[friend_id])
+    
+    __table_args__ = (
+        db.UniqueConstraint('pair_low', 'pair_high', name='uq_friendship_pair'),
+        db.Index('ix_friendship_pair_high', 'pair_high'),
+    )
+    
+    def __init__(self, **kwargs):
+        super(Friendship, self).__init__(**kwargs)
+        self.pair_low, self.pair_high = sorted((self.user_id, self.friend_id))
+    
+    # Named eager-loading strategies, applied with query.options(...) by list endpoints
+    @classmethod
+    def with_sender(cls):
+        return db.joinedload(cls.user)
 
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -95,14 +118,32 @@ class Post(db.Model):
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     
+    # Denormalized counters, maintained by backend.counters
+    likes_count = db.Column(db.Integer, default=0, nullable=False)
+    comments_count = db.Column(db.Integer, default=0, nullable=False)
+    shares_count = db.Column(db.Integer, default=0, nullable=False)
+    reaction_like = db.Column(db.Integer, default=0, nullable=False)
+    reaction_love = db.Column(db.Integer, default=0, nullable=False)
+    reaction_haha = db.Column(db.Integer, default=0, nullable=False)
+    reaction_wow = db.Column(db.Integer, default=0, nullable=False)
+    reaction_sad = db.Column(db.Integer, default=0, nullable=False)
+    reaction_angry = db.Column(db.Integer, default=0, nullable=False)
+    
+    # True once the post has been pushed onto follower timelines (see backend.timeline)
+    fanned_out = db.Column(db.Boolean, default=False, nullable=False)
+    sentiment = db.Column(db.Float)  # TextBlob polarity, NULL until scored (see backend/sentiment.py)
+    
     comments = db.relationship('Comment', backref='post', lazy='dynamic', cascade='all, delete-orphan')
     likes = db.relationship('Like', backref='post', lazy='dynamic', cascade='all, delete-orphan')
     shares = db.relationship('Share', backref='post', lazy='dynamic', cascade='all, delete-orphan')
     
-    @property
-    def sentiment(self):
-        blob = TextBlob(self.content)
-        return blob.sentiment.polarity
+    __table_args__ = (
+        db.Index('ix_post_fanout_author', 'fanned_out', 'user_id', 'created_at'),
+    )
+    
+    @classmethod
+    def with_author(cls):
+        return db.joinedload(cls.author)
 
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -113,9 +154,15 @@ class Comment(db.Model):
     parent_id = db.Column(db.Integer, db.ForeignKey('comment.id'))
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     is_edited = db.Column(db.Boolean, default=False)
+    likes_count = db.Column(db.Integer, default=0, nullable=False)
+    replies_count = db.Column(db.Integer, default=0, nullable=False)
     
     replies = db.relationship('Comment', backref=db.backref('parent', remote_side=[id]), lazy='dynamic')
     likes = db.relationship('CommentLike', backref='comment', lazy='dynamic', cascade='all, delete-orphan')
+    
+    @classmethod
+    def with_author(cls):
+        return db.joinedload(cls.author)
 
 class CommentLike(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -147,14 +194,42 @@ class Story(db.Model):
     text = db.Column(db.Text)
     background_color = db.Column(db.String(20))
     duration = db.Column(db.Integer, default=24)
-    views = db.Column(db.JSON, default=[])
+    views_count = db.Column(db.Integer, default=0, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     expires_at = db.Column(db.DateTime)
     
+    __table_args__ = (
+        # Active-story index: an author's live stories are one contiguous range
+        db.Index('ix_story_author_expires', 'user_id', 'expires_at'),
+        db.Index('ix_story_expires', 'expires_at'),
+    )
+    views = db.relationship('StoryView', backref='story', lazy='dynamic', cascade='all, delete-orphan')
+    
+    @classmethod
+    def with_author(cls):
+        # One batched SELECT for all authors of a tray, instead of a join per story row
+        return db.selectinload(cls.author)
+    
     def __init__(self, **kwargs):
         super(Story, self).__init__(**kwargs)
         self.expires_at = datetime.utcnow() + timedelta(hours=self.duration)
 
+class StoryView(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    story_id = db.Column(db.Integer, db.ForeignKey('story.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    viewer = db.relationship('User')
+    
+    __table_args__ = (
+        db.UniqueConstraint('story_id', 'user_id'),
+        db.Index('ix_story_view_story_created', 'story_id', 'created_at'),
+    )
+    
+    @classmethod
+    def with_viewer(cls):
+        return db.joinedload(cls.viewer)
+
 class Message(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     sender_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
@@ -165,6 +240,31 @@ class Message(db.Model):
     is_deleted_by_sender = db.Column(db.Boolean, default=False)
     is_deleted_by_receiver = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    
+    __table_args__ = (
+        db.Index('ix_message_pair_created', 'sender_id', 'receiver_id', 'created_at'),
+    )
+
+class Conversation(db.Model):
+    # One row per participant, so an inbox is a single range read on (user_id, last_message_at)
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    partner_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    last_message_id = db.Column(db.Integer, db.ForeignKey('message.id'))
+    last_message_snippet = db.Column(db.String(60))
+    last_message_at = db.Column(db.DateTime)
+    last_sender_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    unread_count = db.Column(db.Integer, default=0, nullable=False)
+    partner = db.relationship('User', foreign_keys=[partner_id])
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'partner_id'),
+        db.Index('ix_conversation_user_last_message', 'user_id', 'last_message_at'),
+    )
+    
+    @classmethod
+    def with_partner(cls):
+        return db.joinedload(cls.partner)
 
 class Notification(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -175,8 +275,62 @@ class Notification(db.Model):
     link = db.Column(db.String(200))
     is_read = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    dedupe_key = db.Column(db.String(200), index=True)
+    actor_count = db.Column(db.Integer, default=1, nullable=False)
     user = db.relationship('User', foreign_keys=[user_id])
     sender = db.relationship('User', foreign_keys=[sender_id])
+    actors = db.relationship('NotificationActor', backref='notification', lazy='dynamic', cascade='all, delete-orphan')
+    
+    @classmethod
+    def with_sender(cls):
+        return db.joinedload(cls.sender)
+
+class NotificationActor(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    notification_id = db.Column(db.Integer, db.ForeignKey('notification.id'), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.UniqueConstraint('notification_id', 'user_id'),
+    )
+
+class NotificationIntent(db.Model):
+    # Written in the same transaction as the action that caused it and drained by backend/outbox.py
+    __tablename__ = 'notification_outbox'
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    sender_id = db.Column(db.Integer, db.ForeignKey('user.id'))
+    type = db.Column(db.String(50), nullable=False)
+    content = db.Column(db.Text)
+    link = db.Column(db.String(200))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    # Set once NOTIFICATION_MAX_RETRIES is used up; the row stays for inspection and `flask retry-notifications`
+    failed_at = db.Column(db.DateTime, index=True)
+    error = db.Column(db.Text)
+
+class TimelineEntry(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False, index=True)
+    author_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+    
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'post_id'),
+        # Covers the timeline page read: seek on user_id, walk (created_at, post_id) backwards
+        db.Index('ix_timeline_user_created', 'user_id', 'created_at', 'post_id'),
+        db.Index('ix_timeline_user_author', 'user_id', 'author_id'),
+    )
+
+class MediaBlob(db.Model):
+    # One stored upload in the blob store (see backend/storage.py), keyed by content hash and variant kind
+    id = db.Column(db.Integer, primary_key=True)
+    key = db.Column(db.String(80), unique=True, nullable=False)
+    size = db.Column(db.Integer, default=0, nullable=False)
+    refcount = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
 
 class SavedPost(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -184,6 +338,11 @@ class SavedPost(db.Model):
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False, index=True)
     collection_name = db.Column(db.String(100), default='Saved Items')
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    post = db.relationship('Post')
+    
+    @classmethod
+    def with_post(cls):
+        return db.selectinload(cls.post).joinedload(Post.author)
 
 class Group(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -0,0 +1,221 @@
+import logging
+from datetime import datetime
+from flask import g, has_request_context
+from .extensions import db, socketio
+from .models import Notification, NotificationActor, NotificationIntent, User
+from .counters import update_user_counters
+
+logger = logging.getLogger(__name__)
+
+# Activity on the same target by different people folds into one row:
+# "Alice and 37 others reacted to your post"
+AGGREGATED_TYPES = ('like', 'comment', 'share')
+
+def dedupe_key(intent):
+    if intent['type'] in AGGREGATED_TYPES:
+        return f"{intent['user_id']}:{intent['type']}:{intent['link']}"
+    return f"{intent['user_id']}:{intent['sender_id']}:{intent['type']}:{intent['link']}"
+
+def display_content(notification):
+    if notification.actor_count > 1:
+        return f'and {notification.actor_count - 1} others {notification.content}'
+    return notification.content
+
+class NotificationOutbox:
+    """
+    Transactional outbox for notifications. Request handlers add an intent
+    row to the session next to the write that caused it, so the intent
+    commits or rolls back with that write. A flusher drains the table in
+    batches, writing notifications in bulk and emitting them once per room.
+    Intents with the same dedupe key collapse into one unread row (see
+    AGGREGATED_TYPES), which also makes retrying a failed batch safe.
+
+    A batch that fails is retried one intent at a time; an intent that keeps
+    failing is marked with failed_at after NOTIFICATION_MAX_RETRIES instead
+    of being discarded.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._worker_started = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['notification_outbox'] = self
+        app.after_request(self._flush_after_request)
+
+    def enqueue(self, user_id, sender_id, ntype, content, link=None):
+        """Adds an intent to the current session; it is delivered once the caller commits."""
+        db.session.add(NotificationIntent(
+            user_id=user_id,
+            sender_id=sender_id,
+            type=ntype,
+            content=content,
+            link=link,
+            created_at=datetime.utcnow()
+        ))
+
+        if not self.app.config['NOTIFICATION_OUTBOX_ASYNC']:
+            # Synchronous mode drains once per request, in after_request
+            if has_request_context():
+                g.notification_intents = True
+        else:
+            self.start()
+
+    def start(self):
+        if not self._worker_started and self.app.config['NOTIFICATION_OUTBOX_ASYNC']:
+            self._worker_started = True
+            socketio.start_background_task(self._run)
+
+    def _flush_after_request(self, response):
+        if g.pop('notification_intents', False):
+            self.flush()
+        return response
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.app.config['NOTIFICATION_FLUSH_INTERVAL'])
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Notification outbox flush failed')
+
+    def flush(self):
+        """Writes and delivers committed intents until the outbox is empty or a batch fails."""
+        with self.app.app_context():
+            while self._flush_batch():
+                pass
+
+    def _flush_batch(self):
+        batch = NotificationIntent.query.filter(
+            NotificationIntent.failed_at.is_(None)
+        ).order_by(NotificationIntent.id).limit(
+            self.app.config['NOTIFICATION_BATCH_SIZE']
+        ).with_for_update(skip_locked=True).all()
+        if not batch:
+            return False
+
+        intent_ids = [intent.id for intent in batch]
+        try:
+            notifications = self._write(batch)
+        except Exception:
+            logger.exception('Notification batch of %d intents failed', len(batch))
+            db.session.rollback()
+        else:
+            self._deliver(notifications)
+            return True
+
+        # One at a time, so a single bad intent does not hold back the rest
+        for intent_id in intent_ids:
+            intent = NotificationIntent.query.filter_by(id=intent_id).with_for_update(skip_locked=True).first()
+            if intent is None:
+                continue
+            try:
+                notifications = self._write([intent])
+            except Exception as error:
+                db.session.rollback()
+                self._record_failure(intent_id, error)
+            else:
+                self._deliver(notifications)
+        # Whatever failed waits for the next flush instead of being retried in a tight loop
+        return False
+
+    def _record_failure(self, intent_id, error):
+        intent = db.session.get(NotificationIntent, intent_id)
+        if intent is None:
+            return
+        intent.attempts += 1
+        intent.error = repr(error)
+        if intent.attempts >= self.app.config['NOTIFICATION_MAX_RETRIES']:
+            intent.failed_at = datetime.utcnow()
+            logger.error('Notification intent %d failed %d times, kept as failed: %r', intent_id, intent.attempts, error)
+        else:
+            logger.warning('Notification intent %d failed (attempt %d): %r', intent_id, intent.attempts, error)
+        db.session.commit()
+
+    def retry_failed(self):
+        """Puts intents marked as failed back in line for the flusher; returns how many."""
+        count = NotificationIntent.query.filter(NotificationIntent.failed_at.isnot(None)).update(
+            {'failed_at': None, 'attempts': 0, 'error': None}, synchronize_session=False
+        )
+        db.session.commit()
+        return count
+
+    def _write(self, batch):
+        # Later intents win, e.g. the final reaction of a like/unlike/like burst
+        intents = {}
+        for row in batch:
+            intent = {
+                'user_id': row.user_id,
+                'sender_id': row.sender_id,
+                'type': row.type,
+                'content': row.content,
+                'link': row.link,
+                'created_at': row.created_at
+            }
+            intents.setdefault(dedupe_key(intent), {})[intent['sender_id']] = intent
+
+        existing = {n.dedupe_key: n for n in Notification.query.filter(
+            Notification.dedupe_key.in_(list(intents)),
+            Notification.is_read == False
+        ).all()}
+        # Tracked by dedupe key: new notifications have no id until the commit
+        keys_by_id = {n.id: key for key, n in existing.items()}
+        known_actors = {(keys_by_id[notification_id], user_id) for notification_id, user_id in db.session.query(
+            NotificationActor.notification_id, NotificationActor.user_id
+        ).filter(NotificationActor.notification_id.in_(list(keys_by_id))).all()}
+
+        notifications = {}
+        new_unread = {}
+        for key, by_sender in intents.items():
+            notification = existing.get(key)
+            for sender_id, intent in by_sender.items():
+                if notification is None:
+                    notification = Notification(dedupe_key=key, actor_count=0, **intent)
+                    db.session.add(notification)
+                    new_unread[intent['user_id']] = new_unread.get(intent['user_id'], 0) + 1
+                else:
+                    notification.sender_id = sender_id
+                    notification.content = intent['content']
+                    notification.created_at = intent['created_at']
+
+                if (key, sender_id) not in known_actors:
+                    notification.actor_count += 1
+                    db.session.add(NotificationActor(notification=notification, user_id=sender_id))
+                    known_actors.add((key, sender_id))
+            notifications[key] = notification
+
+        for user_id, count in new_unread.items():
+            update_user_counters(user_id, unread_notifications_count=count)
+
+        # Consumed in the same commit that writes the notifications
+        NotificationIntent.query.filter(
+            NotificationIntent.id.in_([row.id for row in batch])
+        ).delete(synchronize_session=False)
+        db.session.commit()
+        return list(notifications.values())
+
+    def _deliver(self, notifications):
+        sender_ids = {n.sender_id for n in notifications if n.sender_id}
+        senders = {u.id: u.username for u in db.session.query(User.id, User.username).filter(User.id.in_(sender_ids)).all()}
+
+        by_room = {}
+        for n in notifications:
+            by_room.setdefault(n.user_id, []).append({
+                'id': n.id,
+                'type': n.type,
+                'content': display_content(n),
+                'actor_count': n.actor_count,
+                'sender': senders.get(n.sender_id),
+                'created_at': n.created_at.isoformat()
+            })
+
+        for user_id, payloads in by_room.items():
+            if len(payloads) == 1:
+                socketio.emit('new_notification', payloads[0], room=f'user_{user_id}')
+            else:
+                socketio.emit('new_notifications', {'notifications': payloads}, room=f'user_{user_id}')
+
+outbox = NotificationOutbox()
@@ -0,0 +1,88 @@
+import base64
+from datetime import datetime
+from flask import request, jsonify
+
+DEFAULT_PER_PAGE = 10
+MAX_PER_PAGE = 100
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(row):
+    raw = f'{row.created_at.isoformat()}|{row.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        created_at, row_id = raw.rsplit('|', 1)
+        return datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+
+def encode_ranked_cursor(rank, row_id):
+    """Cursor for result lists ordered by (relevance rank, id) rather than recency."""
+    raw = f'{rank!r}|{row_id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def decode_ranked_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        rank, row_id = raw.rsplit('|', 1)
+        return float(rank), int(row_id)
+    except (ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+
+def pagination_args(default_per_page=DEFAULT_PER_PAGE):
+    """Reads cursor / page / per_page / include_total from the query string."""
+    per_page = request.args.get('per_page', default_per_page, type=int)
+    return {
+        'cursor': request.args.get('cursor') or None,
+        'page': request.args.get('page', type=int),
+        'per_page': max(1, min(per_page, MAX_PER_PAGE)),
+        'include_total': request.args.get('include_total', '').lower() in ('1', 'true', 'yes')
+    }
+
+def paginate(query, model, cursor=None, page=None, per_page=DEFAULT_PER_PAGE, include_total=False):
+    """
+    Pages a query newest-first on (model.created_at, model.id).
+
+    With a cursor this is a keyset seek: no OFFSET scan, and rows inserted
+    since the previous page cannot shift results. Without one, the legacy
+    page number is honoured with an OFFSET. Either way one extra row is
+    fetched to compute has_next, so no COUNT runs unless include_total is set.
+    Returns (items, meta) where meta is merged into the JSON response.
+    """
+    if include_total:
+        total = query.order_by(None).count()
+
+    query = query.order_by(None).order_by(model.created_at.desc(), model.id.desc())
+    meta = {}
+
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(
+            (model.created_at < created_at) |
+            ((model.created_at == created_at) & (model.id < row_id))
+        )
+    else:
+        page = max(page or 1, 1)
+        query = query.offset((page - 1) * per_page)
+        meta.update({'current_page': page, 'has_prev': page > 1})
+
+    rows = query.limit(per_page + 1).all()
+    items = rows[:per_page]
+    has_next = len(rows) > per_page
+
+    meta.update({
+        'per_page': per_page,
+        'has_next': has_next,
+        'next_cursor': encode_cursor(items[-1]) if has_next else None
+    })
+    if include_total:
+        meta.update({'total': total, 'pages': -(-total // per_page)})
+
+    return items, meta
+
+def handle_invalid_cursor(error):
+    return jsonify({'message': 'Invalid pagination cursor'}), 400
@@ -0,0 +1,147 @@
+import logging
+import time
+from datetime import datetime
+from sqlalchemy.exc import OperationalError
+from .extensions import db, socketio
+from .models import User
+
+logger = logging.getLogger(__name__)
+
+class MemoryPresenceStore:
+    def __init__(self):
+        self._seen = {}
+
+    def touch(self, user_id, timestamp):
+        self._seen[user_id] = timestamp
+
+    def remove(self, user_id):
+        self._seen.pop(user_id, None)
+
+    def scores(self, user_ids):
+        return {user_id: self._seen.get(user_id) for user_id in user_ids}
+
+    def expire(self, cutoff):
+        expired = {user_id: seen for user_id, seen in self._seen.items() if seen < cutoff}
+        for user_id in expired:
+            del self._seen[user_id]
+        return expired
+
+class RedisPresenceStore:
+    """Shares presence between worker processes through one sorted set (member = user id, score = last heartbeat)."""
+
+    def __init__(self, url, key='presence'):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self._key = key
+
+    def touch(self, user_id, timestamp):
+        self._redis.zadd(self._key, {user_id: timestamp})
+
+    def remove(self, user_id):
+        self._redis.zrem(self._key, user_id)
+
+    def scores(self, user_ids):
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        return dict(zip(user_ids, self._redis.zmscore(self._key, user_ids)))
+
+    def expire(self, cutoff):
+        expired = {int(user_id): seen for user_id, seen in self._redis.zrangebyscore(self._key, '-inf', cutoff, withscores=True)}
+        if expired:
+            self._redis.zrem(self._key, *expired)
+        return expired
+
+class PresenceService:
+    """
+    Tracks who is online from socket heartbeats instead of writing the user
+    table on every event. A user is online while their last heartbeat is
+    younger than PRESENCE_TTL seconds. last_seen / is_online are copied to
+    the database in one batched UPDATE every PRESENCE_FLUSH_INTERVAL seconds.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self.store = MemoryPresenceStore()
+        self._dirty = {}
+        self._flusher_started = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        if app.config['PRESENCE_REDIS_URL']:
+            self.store = RedisPresenceStore(app.config['PRESENCE_REDIS_URL'])
+        app.extensions['presence'] = self
+
+    def heartbeat(self, user_id):
+        now = time.time()
+        self.store.touch(user_id, now)
+        self._dirty[user_id] = (now, True)
+        self._start_flusher()
+
+    def disconnect(self, user_id):
+        self.store.remove(user_id)
+        self._dirty[user_id] = (time.time(), False)
+        self._start_flusher()
+
+    def statuses(self, user_ids):
+        """Returns {user_id: (is_online, last_seen or None)} for a batch of users."""
+        cutoff = time.time() - self.app.config['PRESENCE_TTL']
+        result = {}
+        for user_id, seen in self.store.scores(user_ids).items():
+            if seen is None:
+                result[user_id] = (False, None)
+            else:
+                result[user_id] = (seen >= cutoff, datetime.utcfromtimestamp(seen))
+        return result
+
+    def status(self, user_id):
+        return self.statuses([user_id])[user_id]
+
+    def _start_flusher(self):
+        if not self._flusher_started:
+            self._flusher_started = True
+            socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.app.config['PRESENCE_FLUSH_INTERVAL'])
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Presence flush failed')
+
+    def flush(self):
+        """Expires silent users and writes pending last_seen/is_online changes in one batch."""
+        expired = self.store.expire(time.time() - self.app.config['PRESENCE_TTL'])
+        for user_id, seen in expired.items():
+            self._dirty[user_id] = (seen, False)
+
+        if not self._dirty:
+            return
+        dirty, self._dirty = self._dirty, {}
+
+        try:
+            with self.app.app_context():
+                # Core executemany by id: a user deleted since the heartbeat just matches no row
+                users = User.__table__
+                db.session.execute(users.update().where(users.c.id == db.bindparam('user_id')).values(
+                    last_seen=db.bindparam('last_seen'),
+                    is_online=db.bindparam('is_online')
+                ), [{
+                    'user_id': user_id,
+                    'last_seen': datetime.utcfromtimestamp(seen),
+                    'is_online': online
+                } for user_id, (seen, online) in dirty.items()])
+                db.session.commit()
+        except OperationalError:
+            # The database is unreachable: keep the changes for the next flush unless newer ones arrived meanwhile
+            for user_id, change in dirty.items():
+                self._dirty.setdefault(user_id, change)
+            raise
+        except Exception:
+            # Anything else would fail again on every retry, so the batch is dropped
+            logger.exception('Dropping %d presence updates', len(dirty))
+
+presence = PresenceService()
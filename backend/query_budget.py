@@ -0,0 +1,37 @@
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from .extensions import db
+
+class QueryBudgetExceeded(AssertionError):
+    """A request issued more SQL statements than MAX_QUERIES_PER_REQUEST, usually an N+1 loop."""
+
+def _count_statement(conn, cursor, statement, parameters, context, executemany):
+    # Background flushes run in their own app context, outside any request
+    if has_request_context():
+        g.query_count = g.get('query_count', 0) + 1
+
+def init_query_budget(app):
+    """
+    With MAX_QUERIES_PER_REQUEST set, counts the statements each request
+    sends and raises QueryBudgetExceeded once the response is built if it
+    went over. The test config sets it so a lost eager load fails loudly.
+    """
+    limit = app.config['MAX_QUERIES_PER_REQUEST']
+    if not limit:
+        return
+
+    with app.app_context():
+        if not event.contains(db.engine, 'before_cursor_execute', _count_statement):
+            event.listen(db.engine, 'before_cursor_execute', _count_statement)
+
+    @app.before_request
+    def reset_query_count():
+        # g outlives the request when an app context was already pushed (tests, CLI)
+        g.query_count = 0
+
+    @app.after_request
+    def check_query_budget(response):
+        count = g.get('query_count', 0)
+        if count > limit:
+            raise QueryBudgetExceeded(f'{request.method} {request.path} issued {count} SQL statements (limit {limit})')
+        return response
@@ -5,6 +5,9 @@ from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identi
 from datetime import datetime
 from ..models import User
 from ..extensions import db, limiter
+from ..presence import presence
+from ..search import search_index
+from ..typeahead import user_prefix_index
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -38,7 +41,10 @@ def register():
     )
     
     db.session.add(new_user)
+    db.session.flush()
+    search_index.index_user(new_user)
     db.session.commit()
+    user_prefix_index.update(new_user)
     
     return jsonify({
         'message': 'Welcome to the community! Your account has been created successfully.',
@@ -55,9 +61,7 @@ def login():
     if not user or not check_password_hash(user.password, data['password']):
         return jsonify({'message': 'Invalid credentials'}), 401
     
-    user.is_online = True
-    user.last_seen = datetime.utcnow()
-    db.session.commit()
+    presence.heartbeat(user.id)
     
     access_token = create_access_token(identity=user.id)
     
@@ -79,10 +83,6 @@ def login():
 @jwt_required()
 def logout():
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    if user:
-        user.is_online = False
-        user.last_seen = datetime.utcnow()
-        db.session.commit()
+    presence.disconnect(current_user_id)
     
     return jsonify({'message': 'See you soon!'}), 200
\ No newline at end of file
@@ -1,11 +1,22 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
+from sqlalchemy.exc import IntegrityError
 from ..models import User, Friendship, Post
 from ..extensions import db
 from ..helpers import create_notification
+from ..feed import hydrate_posts
+from ..timeline import backfill_timeline, remove_author_from_timeline
+from ..pagination import pagination_args
+from ..presence import presence
+from ..search import search_index
+from ..typeahead import user_prefix_index
+from ..graph import follow, unfollow, graph_cache, friendship_between, relationships
+from ..feed import serialize_author
 
 friends_bp = Blueprint('friends', __name__)
 
+MAX_RELATIONSHIP_IDS = 500
+
 @friends_bp.route('/friends/request', methods=['POST'])
 @jwt_required()
 def send_friend_request():
@@ -16,18 +27,11 @@ def send_friend_request():
     if current_user_id == friend_id:
         return jsonify({'message': 'You cannot send a friend request to yourself'}), 400
     
-    existing = Friendship.query.filter(
-        ((Friendship.user_id == current_user_id) & (Friendship.friend_id == friend_id)) |
-        ((Friendship.user_id == friend_id) & (Friendship.friend_id == current_user_id))
-    ).first()
-    
-    if existing:
+    if friendship_between(current_user_id, friend_id):
         return jsonify({'message': 'Friend request already exists or you are already friends'}), 400
     
     friendship = Friendship(user_id=current_user_id, friend_id=friend_id)
     db.session.add(friendship)
-    db.session.commit()
-    
     create_notification(
         friend_id,
         current_user_id,
@@ -35,6 +39,12 @@ def send_friend_request():
         'sent you a friend request',
         f'/profile/{current_user_id}'
     )
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # The other user sent a request at the same moment
+        db.session.rollback()
+        return jsonify({'message': 'Friend request already exists or you are already friends'}), 400
     
     return jsonify({'message': 'Friend request sent!'}), 201
 
@@ -49,13 +59,11 @@ def accept_friend_request(friendship_id):
     
     friendship.status = 'accepted'
     
-    current_user = User.query.get(current_user_id)
     friend = User.query.get(friendship.user_id)
-    current_user.follow(friend)
-    friend.follow(current_user)
-    
-    db.session.commit()
-    
+    follow(current_user_id, friend.id)
+    follow(friend.id, current_user_id)
+    backfill_timeline(current_user_id, friend.id)
+    backfill_timeline(friend.id, current_user_id)
     create_notification(
         friendship.user_id,
         current_user_id,
@@ -64,6 +72,8 @@ def accept_friend_request(friendship_id):
         f'/profile/{current_user_id}'
     )
     
+    db.session.commit()
+    
     return jsonify({'message': f'You and {friend.first_name} are now friends!'}), 200
 
 @friends_bp.route('/friends/reject/<int:friendship_id>', methods=['DELETE'])
@@ -85,7 +95,7 @@ def reject_friend_request(friendship_id):
 def get_friend_requests():
     current_user_id = get_jwt_identity()
     
-    requests = Friendship.query.filter_by(friend_id=current_user_id, status='pending').all()
+    requests = Friendship.query.filter_by(friend_id=current_user_id, status='pending').options(Friendship.with_sender()).all()
     
     requests_data = [{
         'id': r.id,
@@ -105,9 +115,9 @@ def get_friend_requests():
 @jwt_required()
 def get_friends():
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
     
-    friends = user.following.all()
+    friends = User.query.filter(User.id.in_(graph_cache.following(current_user_id).tolist())).all()
+    statuses = presence.statuses([f.id for f in friends])
     
     friends_data = [{
         'id': f.id,
@@ -115,26 +125,53 @@ def get_friends():
         'first_name': f.first_name,
         'last_name': f.last_name,
         'profile_picture': f.profile_picture,
-        'is_online': f.is_online,
-        'last_seen': f.last_seen.isoformat()
+        'is_online': statuses[f.id][0],
+        'last_seen': (statuses[f.id][1] or f.last_seen).isoformat()
     } for f in friends]
     
     return jsonify({'friends': friends_data}), 200
 
+@friends_bp.route('/relationships', methods=['GET'])
+@jwt_required()
+def get_relationships():
+    current_user_id = get_jwt_identity()
+    
+    try:
+        user_ids = {int(user_id) for user_id in request.args.get('ids', '').split(',') if user_id.strip()}
+    except ValueError:
+        return jsonify({'message': 'ids must be a comma-separated list of user ids'}), 400
+    if len(user_ids) > MAX_RELATIONSHIP_IDS:
+        return jsonify({'message': f'At most {MAX_RELATIONSHIP_IDS} ids per request'}), 400
+    
+    state = relationships(current_user_id, user_ids)
+    return jsonify({'relationships': {str(user_id): s for user_id, s in state.items()}}), 200
+
+@friends_bp.route('/friends/suggestions', methods=['GET'])
+@jwt_required()
+def get_friend_suggestions():
+    current_user_id = get_jwt_identity()
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
+    
+    suggestions = graph_cache.suggestions(current_user_id, limit)
+    users = {u.id: u for u in User.query.filter(User.id.in_([user_id for user_id, _ in suggestions])).all()}
+    
+    return jsonify({'suggestions': [
+        dict(serialize_author(users[user_id]), mutual_count=mutual)
+        for user_id, mutual in suggestions if user_id in users
+    ]}), 200
+
 @friends_bp.route('/friends/unfriend/<int:friend_id>', methods=['DELETE'])
 @jwt_required()
 def unfriend(friend_id):
     current_user_id = get_jwt_identity()
-    current_user = User.query.get(current_user_id)
-    friend = User.query.get_or_404(friend_id)
+    User.query.get_or_404(friend_id)
     
-    current_user.unfollow(friend)
-    friend.unfollow(current_user)
+    unfollow(current_user_id, friend_id)
+    unfollow(friend_id, current_user_id)
+    remove_author_from_timeline(current_user_id, friend_id)
+    remove_author_from_timeline(friend_id, current_user_id)
     
-    friendship = Friendship.query.filter(
-        ((Friendship.user_id == current_user_id) & (Friendship.friend_id == friend_id)) |
-        ((Friendship.user_id == friend_id) & (Friendship.friend_id == current_user_id))
-    ).first()
+    friendship = friendship_between(current_user_id, friend_id)
     
     if friendship:
         db.session.delete(friendship)
@@ -147,15 +184,13 @@ def unfriend(friend_id):
 @jwt_required()
 def follow_user(user_id):
     current_user_id = get_jwt_identity()
-    current_user = User.query.get(current_user_id)
     user_to_follow = User.query.get_or_404(user_id)
     
     if current_user_id == user_id:
         return jsonify({'message': 'You cannot follow yourself'}), 400
     
-    current_user.follow(user_to_follow)
-    db.session.commit()
-    
+    follow(current_user_id, user_id)
+    backfill_timeline(current_user_id, user_id)
     create_notification(
         user_id,
         current_user_id,
@@ -163,6 +198,7 @@ def follow_user(user_id):
         'started following you',
         f'/profile/{current_user_id}'
     )
+    db.session.commit()
     
     return jsonify({'message': f'You are now following {user_to_follow.first_name}!'}), 200
 
@@ -170,28 +206,39 @@ def follow_user(user_id):
 @jwt_required()
 def unfollow_user(user_id):
     current_user_id = get_jwt_identity()
-    current_user = User.query.get(current_user_id)
     user_to_unfollow = User.query.get_or_404(user_id)
     
-    current_user.unfollow(user_to_unfollow)
+    unfollow(current_user_id, user_id)
+    remove_author_from_timeline(current_user_id, user_id)
     db.session.commit()
     
     return jsonify({'message': f'You unfollowed {user_to_unfollow.first_name}'}), 200
 
+@friends_bp.route('/search/users/suggest', methods=['GET'])
+@jwt_required()
+def suggest_users():
+    current_user_id = get_jwt_identity()
+    query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 8, type=int), 20))
+    
+    return jsonify({'users': user_prefix_index.suggest(query, current_user_id, limit)}), 200
+
 @friends_bp.route('/search', methods=['GET'])
 @jwt_required()
 def search():
     query = request.args.get('q', '')
     search_type = request.args.get('type', 'all')
+    pagination = pagination_args(20)
+    
+    # A cursor belongs to a single result list, so it is only honoured for type=users or type=posts
+    cursor = pagination['cursor'] if search_type != 'all' else None
     
     results = {}
     
     if search_type in ['all', 'users']:
-        users = User.query.filter(
-            (User.username.ilike(f'%{query}%')) |
-            (User.first_name.ilike(f'%{query}%')) |
-            (User.last_name.ilike(f'%{query}%'))
-        ).limit(20).all()
+        user_ids, next_cursor = search_index.search_users(query, cursor, pagination['per_page'])
+        found = {u.id: u for u in User.query.filter(User.id.in_(user_ids)).all()}
+        users = [found[user_id] for user_id in user_ids if user_id in found]
         
         results['users'] = [{
             'id': u.id,
@@ -201,20 +248,25 @@ def search():
             'profile_picture': u.profile_picture,
             'is_verified': u.is_verified
         } for u in users]
+        results['users_next_cursor'] = next_cursor
     
     if search_type in ['all', 'posts']:
-        posts = Post.query.filter(Post.content.ilike(f'%{query}%')).order_by(Post.created_at.desc()).limit(20).all()
+        post_ids, next_cursor = search_index.search_posts(query, cursor, pagination['per_page'])
+        found = {p.id: p for p in Post.query.options(Post.with_author()).filter(Post.id.in_(post_ids)).all()}
+        posts = [found[post_id] for post_id in post_ids if post_id in found]
+        hydrated = hydrate_posts(posts)
         
         results['posts'] = [{
             'id': p.id,
             'content': p.content[:200] + '...' if len(p.content) > 200 else p.content,
             'author': {
-                'id': p.author.id,
-                'username': p.author.username,
-                'first_name': p.author.first_name,
-                'profile_picture': p.author.profile_picture
+                'id': hydrated[p.id]['author']['id'],
+                'username': hydrated[p.id]['author']['username'],
+                'first_name': hydrated[p.id]['author']['first_name'],
+                'profile_picture': hydrated[p.id]['author']['profile_picture']
             },
             'created_at': p.created_at.isoformat()
         } for p in posts]
+        results['posts_next_cursor'] = next_cursor
     
     return jsonify(results), 200
\ No newline at end of file
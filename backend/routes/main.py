@@ -1,4 +1,8 @@
-from flask import Blueprint, render_template, jsonify
+from flask import Blueprint, Response, render_template, jsonify
+from ..extensions import limiter
+from ..serving import send_media
+from ..graph import graph_cache
+from ..metrics import request_metrics
 
 main_bp = Blueprint('main', __name__)
 
@@ -7,11 +11,40 @@ def serve_app():
     """Serves the main frontend application."""
     return render_template('index.html')
 
+@main_bp.route('/uploads/<path:filename>')
+@limiter.exempt
+def serve_upload(filename):
+    """Serves uploaded media with immutable caching, ETags and Range support."""
+    return send_media(filename)
+
 @main_bp.route('/api/status')
 def api_status():
     """Provides a simple status check for the API."""
     return jsonify({
         'message': 'Facebook Replica API - Advanced Humanized Edition',
         'version': '2.0',
-        'status': 'running'
-    })
\ No newline at end of file
+        'status': 'running',
+        'graph_cache': graph_cache.stats()
+    })
+
+@main_bp.route('/api/_metrics')
+@limiter.exempt
+def api_metrics():
+    """Per-endpoint request and SQL metrics in Prometheus text format."""
+    if not request_metrics.authorized():
+        return jsonify({'message': 'Unauthorized'}), 401
+
+    cache = graph_cache.stats()
+    return Response(request_metrics.render({
+        'faceconnect_graph_cache_hits_total': ('counter', 'Follow-graph cache hits.', cache['hits']),
+        'faceconnect_graph_cache_misses_total': ('counter', 'Follow-graph cache misses.', cache['misses']),
+        'faceconnect_graph_cache_invalidations_total': ('counter', 'Follow-graph cache invalidations.', cache['invalidations'])
+    }), mimetype='text/plain; version=0.0.4')
+
+@main_bp.route('/api/_metrics/slow-queries')
+@limiter.exempt
+def api_slow_queries():
+    """Slow statement fingerprints with their query plans, slowest in total first."""
+    if not request_metrics.authorized():
+        return jsonify({'message': 'Unauthorized'}), 401
+    return jsonify({'slow_queries': request_metrics.slow_queries()})
\ No newline at end of file
@@ -1,8 +1,12 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from ..models import Message, User
+from ..models import Message, User, Conversation
 from ..extensions import db, socketio
 from ..helpers import sanitize_content, create_notification
+from ..pagination import paginate, pagination_args, MAX_PER_PAGE
+from ..conversations import record_message, mark_conversation_read
+from ..presence import presence
+from ..storage import media_storage
 
 messaging_bp = Blueprint('messaging', __name__)
 
@@ -22,6 +26,16 @@ def send_message():
     )
     
     db.session.add(message)
+    db.session.flush()
+    media_storage.retain([message.image])
+    record_message(message)
+    create_notification(
+        data['receiver_id'],
+        current_user_id,
+        'message',
+        f'sent you a message',
+        f'/messages/{current_user_id}'
+    )
     db.session.commit()
     
     sender = User.query.get(current_user_id)
@@ -38,14 +52,6 @@ def send_message():
         'created_at': message.created_at.isoformat()
     }, room=f'user_{data["receiver_id"]}')
     
-    create_notification(
-        data['receiver_id'],
-        current_user_id,
-        'message',
-        f'sent you a message',
-        f'/messages/{current_user_id}'
-    )
-    
     return jsonify({'message': 'Message sent!', 'message_id': message.id}), 201
 
 @messaging_bp.route('/messages/<int:user_id>', methods=['GET'])
@@ -53,13 +59,25 @@ def send_message():
 def get_messages(user_id):
     current_user_id = get_jwt_identity()
     
-    messages = Message.query.filter(
+    conversation = Message.query.filter(
         ((Message.sender_id == current_user_id) & (Message.receiver_id == user_id)) |
         ((Message.sender_id == user_id) & (Message.receiver_id == current_user_id))
-    ).order_by(Message.created_at.asc()).all()
+    )
     
-    Message.query.filter_by(sender_id=user_id, receiver_id=current_user_id, is_read=False).update({'is_read': True})
-    db.session.commit()
+    since_id = request.args.get('since_id', type=int)
+    
+    if since_id is not None:
+        # Delta sync for reconnecting clients: everything after the last message they have
+        rows = conversation.filter(Message.id > since_id).order_by(Message.id.asc()).limit(MAX_PER_PAGE + 1).all()
+        messages = rows[:MAX_PER_PAGE]
+        meta = {'has_more': len(rows) > MAX_PER_PAGE}
+    else:
+        # Latest window; next_cursor loads older messages
+        messages, meta = paginate(conversation, Message, **pagination_args(50))
+        messages.reverse()
+    
+    if mark_conversation_read(current_user_id, user_id):
+        db.session.commit()
     
     messages_data = [{
         'id': m.id,
@@ -70,47 +88,35 @@ def get_messages(user_id):
         'is_read': m.is_read,
         'created_at': m.created_at.isoformat()
     } for m in messages]
+    meta['latest_id'] = max((m.id for m in messages), default=since_id)
     
-    return jsonify({'messages': messages_data}), 200
+    return jsonify(dict({'messages': messages_data}, **meta)), 200
 
 @messaging_bp.route('/conversations', methods=['GET'])
 @jwt_required()
 def get_conversations():
     current_user_id = get_jwt_identity()
     
-    sent = db.session.query(Message.receiver_id, db.func.max(Message.created_at)).filter_by(sender_id=current_user_id).group_by(Message.receiver_id).all()
-    received = db.session.query(Message.sender_id, db.func.max(Message.created_at)).filter_by(receiver_id=current_user_id).group_by(Message.sender_id).all()
-    
-    conversations = {}
-    for user_id, last_msg_time in sent + received:
-        if user_id not in conversations or conversations[user_id] < last_msg_time:
-            conversations[user_id] = last_msg_time
+    conversations = Conversation.query.filter_by(user_id=current_user_id).options(
+        Conversation.with_partner()
+    ).order_by(Conversation.last_message_at.desc()).all()
+    statuses = presence.statuses([c.partner_id for c in conversations])
     
-    conv_data = []
-    for user_id, last_time in sorted(conversations.items(), key=lambda x: x[1], reverse=True):
-        user = User.query.get(user_id)
-        last_msg = Message.query.filter(
-            ((Message.sender_id == current_user_id) & (Message.receiver_id == user_id)) |
-            ((Message.sender_id == user_id) & (Message.receiver_id == current_user_id))
-        ).order_by(Message.created_at.desc()).first()
-        
-        unread = Message.query.filter_by(sender_id=user_id, receiver_id=current_user_id, is_read=False).count()
-        
-        conv_data.append({
-            'user': {
-                'id': user.id,
-                'username': user.username,
-                'first_name': user.first_name,
-                'last_name': user.last_name,
-                'profile_picture': user.profile_picture,
-                'is_online': user.is_online
-            },
-            'last_message': {
-                'content': last_msg.content[:50] + '...' if len(last_msg.content) > 50 else last_msg.content,
-                'created_at': last_msg.created_at.isoformat(),
-                'is_own': last_msg.sender_id == current_user_id
-            },
-            'unread_count': unread
-        })
+    conv_data = [{
+        'user': {
+            'id': c.partner.id,
+            'username': c.partner.username,
+            'first_name': c.partner.first_name,
+            'last_name': c.partner.last_name,
+            'profile_picture': c.partner.profile_picture,
+            'is_online': statuses[c.partner_id][0]
+        },
+        'last_message': {
+            'content': c.last_message_snippet,
+            'created_at': c.last_message_at.isoformat(),
+            'is_own': c.last_sender_id == current_user_id
+        },
+        'unread_count': c.unread_count
+    } for c in conversations]
     
     return jsonify({'conversations': conv_data}), 200
\ No newline at end of file
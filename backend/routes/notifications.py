@@ -1,7 +1,10 @@
-from flask import Blueprint, jsonify
+from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from ..models import Notification
+from ..models import Notification, User
 from ..extensions import db
+from ..pagination import paginate, pagination_args
+from ..outbox import display_content
+from ..counters import update_user_counters
 
 notifications_bp = Blueprint('notifications', __name__)
 
@@ -10,12 +13,17 @@ notifications_bp = Blueprint('notifications', __name__)
 def get_notifications():
     current_user_id = get_jwt_identity()
     
-    notifications = Notification.query.filter_by(user_id=current_user_id).order_by(Notification.created_at.desc()).limit(50).all()
+    notifications, meta = paginate(
+        Notification.query.filter_by(user_id=current_user_id).options(Notification.with_sender()),
+        Notification,
+        **pagination_args(50)
+    )
     
     notif_data = [{
         'id': n.id,
         'type': n.type,
-        'content': n.content,
+        'content': display_content(n),
+        'actor_count': n.actor_count,
         'link': n.link,
         'is_read': n.is_read,
         'created_at': n.created_at.isoformat(),
@@ -27,7 +35,38 @@ def get_notifications():
         } if n.sender else None
     } for n in notifications]
     
-    return jsonify({'notifications': notif_data}), 200
+    return jsonify(dict({'notifications': notif_data}, **meta)), 200
+
+@notifications_bp.route('/notifications/unread-count', methods=['GET'])
+@jwt_required()
+def get_unread_count():
+    current_user_id = get_jwt_identity()
+    unread = db.session.query(User.unread_notifications_count).filter_by(id=current_user_id).scalar()
+    
+    return jsonify({'unread_count': max(unread or 0, 0)}), 200
+
+@notifications_bp.route('/notifications/read', methods=['PUT'])
+@jwt_required()
+def mark_notifications_read():
+    current_user_id = get_jwt_identity()
+    # {} marks everything read, {"up_to_id": N} only notifications up to N
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({'message': 'Expected a JSON object body'}), 400
+    
+    unread = Notification.query.filter_by(user_id=current_user_id, is_read=False)
+    if 'up_to_id' in data:
+        try:
+            up_to_id = int(data['up_to_id'])
+        except (TypeError, ValueError):
+            return jsonify({'message': 'up_to_id must be an integer'}), 400
+        unread = unread.filter(Notification.id <= up_to_id)
+    
+    updated = unread.update({'is_read': True}, synchronize_session=False)
+    update_user_counters(current_user_id, unread_notifications_count=-updated)
+    db.session.commit()
+    
+    return jsonify({'message': 'Notifications marked as read', 'updated': updated}), 200
 
 @notifications_bp.route('/notifications/<int:notif_id>/read', methods=['PUT'])
 @jwt_required()
@@ -38,7 +77,9 @@ def mark_notification_read(notif_id):
     if notification.user_id != current_user_id:
         return jsonify({'message': 'Unauthorized'}), 403
     
-    notification.is_read = True
-    db.session.commit()
+    if not notification.is_read:
+        notification.is_read = True
+        update_user_counters(current_user_id, unread_notifications_count=-1)
+        db.session.commit()
     
-    return jsonify({'message': 'Notification marked as read'}), 200
\ No newline at end of file
+    return jsonify({'message': 'Notification marked as read'}), 200
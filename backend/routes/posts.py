@@ -1,9 +1,17 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from datetime import datetime, timedelta
-from ..models import Post, Like, Comment, CommentLike, Share, SavedPost, User
+from ..models import Post, Like, Comment, CommentLike, Share, SavedPost
 from ..extensions import db
 from ..helpers import sanitize_content, create_notification, get_user_feed
+from ..feed import hydrate_posts
+from ..counters import record_reaction, update_post_counters, update_comment_counters, update_user_counters
+from ..timeline import fan_out_post, remove_post_from_timelines
+from ..pagination import paginate, pagination_args
+from ..search import search_index
+from ..sentiment import sentiment_scorer, sentiment_label
+from ..media import upload_from_request
+from ..storage import media_storage
 
 posts_bp = Blueprint('posts', __name__)
 
@@ -27,86 +35,65 @@ def create_post():
     )
     
     db.session.add(new_post)
+    update_user_counters(current_user_id, posts_count=1)
+    db.session.flush()
+    media_storage.retain(new_post.images or [])
+    fan_out_post(new_post)
+    search_index.index_post(new_post)
+    for tagged_user_id in data.get('tagged_users') or []:
+        create_notification(
+            tagged_user_id,
+            current_user_id,
+            'tag',
+            f'tagged you in a post',
+            f'/post/{new_post.id}'
+        )
     db.session.commit()
-    
-    if data.get('tagged_users'):
-        for tagged_user_id in data['tagged_users']:
-            create_notification(
-                tagged_user_id,
-                current_user_id,
-                'tag',
-                f'tagged you in a post',
-                f'/post/{new_post.id}'
-            )
+    sentiment_scorer.enqueue(new_post.id)
     
     return jsonify({
         'message': 'Your post has been shared!',
         'post_id': new_post.id,
-        'sentiment': 'positive' if new_post.sentiment > 0 else 'negative' if new_post.sentiment < 0 else 'neutral'
+        'sentiment': sentiment_label(new_post.sentiment)
     }), 201
 
+@posts_bp.route('/upload/post-image', methods=['POST'])
+@jwt_required()
+def upload_post_image():
+    # The returned url goes into the images list of POST /posts
+    url, variants = upload_from_request('post')
+    return jsonify({'url': url, 'variants': variants}), 201
+
 @posts_bp.route('/feed', methods=['GET'])
 @jwt_required()
 def get_feed():
     current_user_id = get_jwt_identity()
-    page = request.args.get('page', 1, type=int)
-    per_page = request.args.get('per_page', 10, type=int)
     
-    posts = get_user_feed(current_user_id, page, per_page)
+    posts, meta = get_user_feed(current_user_id, **pagination_args())
     
-    posts_data = []
-    for post in posts.items:
-        current_user_liked = Like.query.filter_by(user_id=current_user_id, post_id=post.id).first()
-        
-        posts_data.append({
-            'id': post.id,
-            'content': post.content,
-            'images': post.images,
-            'video': post.video,
-            'location': post.location,
-            'feeling': post.feeling,
-            'privacy': post.privacy,
-            'is_edited': post.is_edited,
-            'created_at': post.created_at.isoformat(),
-            'author': {
-                'id': post.author.id,
-                'username': post.author.username,
-                'first_name': post.author.first_name,
-                'last_name': post.author.last_name,
-                'profile_picture': post.author.profile_picture,
-                'is_verified': post.author.is_verified
-            },
-            'likes_count': post.likes.count(),
-            'comments_count': post.comments.count(),
-            'shares_count': post.shares.count(),
-            'user_liked': current_user_liked is not None,
-            'user_reaction': current_user_liked.reaction_type if current_user_liked else None,
-            'reactions': {
-                'like': post.likes.filter_by(reaction_type='like').count(),
-                'love': post.likes.filter_by(reaction_type='love').count(),
-                'haha': post.likes.filter_by(reaction_type='haha').count(),
-                'wow': post.likes.filter_by(reaction_type='wow').count(),
-                'sad': post.likes.filter_by(reaction_type='sad').count(),
-                'angry': post.likes.filter_by(reaction_type='angry').count()
-            }
-        })
+    hydrated = hydrate_posts(posts, current_user_id)
     
-    return jsonify({
-        'posts': posts_data,
-        'total': posts.total,
-        'pages': posts.pages,
-        'current_page': posts.page,
-        'has_next': posts.has_next,
-        'has_prev': posts.has_prev
-    }), 200
+    posts_data = [dict({
+        'id': post.id,
+        'content': post.content,
+        'images': post.images,
+        'video': post.video,
+        'location': post.location,
+        'feeling': post.feeling,
+        'privacy': post.privacy,
+        'is_edited': post.is_edited,
+        'created_at': post.created_at.isoformat()
+    }, **hydrated[post.id]) for post in posts]
+    
+    return jsonify(dict({'posts': posts_data}, **meta)), 200
 
 @posts_bp.route('/posts/<int:post_id>', methods=['GET'])
 @jwt_required()
 def get_post(post_id):
-    post = Post.query.get_or_404(post_id)
+    post = Post.query.options(Post.with_author()).filter_by(id=post_id).first_or_404()
     
     comments_data = []
-    for c in post.comments.filter_by(parent_id=None).order_by(Comment.created_at.desc()).all():
+    for c in post.comments.options(Comment.with_author()).filter_by(parent_id=None).order_by(Comment.created_at.desc()).all():
         comments_data.append({
             'id': c.id,
             'content': c.content,
@@ -120,8 +107,8 @@ def get_post(post_id):
                 'last_name': c.author.last_name,
                 'profile_picture': c.author.profile_picture
             },
-            'likes_count': c.likes.count(),
-            'replies_count': c.replies.count()
+            'likes_count': c.likes_count,
+            'replies_count': c.replies_count
         })
     
     return jsonify({
@@ -140,9 +127,9 @@ def get_post(post_id):
             'profile_picture': post.author.profile_picture,
             'is_verified': post.author.is_verified
         },
-        'likes_count': post.likes.count(),
+        'likes_count': post.likes_count,
         'comments': comments_data,
-        'shares_count': post.shares.count()
+        'shares_count': post.shares_count
     }), 200
 
 @posts_bp.route('/posts/<int:post_id>', methods=['PUT'])
@@ -158,8 +145,11 @@ def update_post(post_id):
     post.content = sanitize_content(data['content'])
     post.is_edited = True
     post.updated_at = datetime.utcnow()
+    post.sentiment = None
+    search_index.index_post(post)
     
     db.session.commit()
+    sentiment_scorer.enqueue(post.id)
     
     return jsonify({'message': 'Post updated successfully!'}), 200
 
@@ -172,7 +162,13 @@ def delete_post(post_id):
     if post.user_id != current_user_id:
         return jsonify({'message': 'You can only delete your own posts'}), 403
     
+    remove_post_from_timelines(post_id)
+    search_index.remove_post(post_id)
+    media_storage.release((post.images or []) + [
+        image for (image,) in db.session.query(Comment.image).filter(Comment.post_id == post_id, Comment.image.isnot(None))
+    ])
     db.session.delete(post)
+    update_user_counters(current_user_id, posts_count=-1)
     db.session.commit()
     
     return jsonify({'message': 'Post deleted successfully'}), 200
@@ -191,17 +187,18 @@ def react_to_post(post_id):
     if existing_like:
         if existing_like.reaction_type == reaction_type:
             db.session.delete(existing_like)
+            record_reaction(post_id, removed=reaction_type)
             db.session.commit()
             return jsonify({'message': 'Reaction removed'}), 200
         else:
+            record_reaction(post_id, added=reaction_type, removed=existing_like.reaction_type)
             existing_like.reaction_type = reaction_type
             db.session.commit()
             return jsonify({'message': f'Changed reaction to {reaction_type}'}), 200
     
     new_like = Like(user_id=current_user_id, post_id=post_id, reaction_type=reaction_type)
     db.session.add(new_like)
-    db.session.commit()
-    
+    record_reaction(post_id, added=reaction_type)
     if post.user_id != current_user_id:
         create_notification(
             post.user_id,
@@ -210,6 +207,7 @@ def react_to_post(post_id):
             f'reacted {reaction_type} to your post',
             f'/post/{post_id}'
         )
+    db.session.commit()
     
     return jsonify({'message': f'Reacted with {reaction_type}!'}), 201
 
@@ -231,8 +229,10 @@ def create_comment(post_id):
     )
     
     db.session.add(new_comment)
-    db.session.commit()
-    
+    media_storage.retain([new_comment.image])
+    update_post_counters(post_id, comments_count=1)
+    if new_comment.parent_id:
+        update_comment_counters(new_comment.parent_id, replies_count=1)
     if post.user_id != current_user_id:
         create_notification(
             post.user_id,
@@ -241,6 +241,7 @@ def create_comment(post_id):
             f'commented on your post: "{content[:50]}..."',
             f'/post/{post_id}'
         )
+    db.session.commit()
     
     return jsonify({
         'message': 'Comment posted!',
@@ -274,6 +275,10 @@ def delete_comment(comment_id):
         return jsonify({'message': 'You can only delete your own comments'}), 403
     
     db.session.delete(comment)
+    media_storage.release([comment.image])
+    update_post_counters(comment.post_id, comments_count=-1)
+    if comment.parent_id:
+        update_comment_counters(comment.parent_id, replies_count=-1)
     db.session.commit()
     
     return jsonify({'message': 'Comment deleted'}), 200
@@ -288,11 +293,13 @@ def like_comment(comment_id):
     
     if existing:
         db.session.delete(existing)
+        update_comment_counters(comment_id, likes_count=-1)
         db.session.commit()
         return jsonify({'message': 'Like removed'}), 200
     
     new_like = CommentLike(user_id=current_user_id, comment_id=comment_id)
     db.session.add(new_like)
+    update_comment_counters(comment_id, likes_count=1)
     db.session.commit()
     
     return jsonify({'message': 'Comment liked!'}), 201
@@ -311,8 +318,7 @@ def share_post(post_id):
     )
     
     db.session.add(new_share)
-    db.session.commit()
-    
+    update_post_counters(post_id, shares_count=1)
     if post.user_id != current_user_id:
         create_notification(
             post.user_id,
@@ -321,6 +327,7 @@ def share_post(post_id):
             'shared your post',
             f'/post/{post_id}'
         )
+    db.session.commit()
     
     return jsonify({'message': 'Post shared to your timeline!'}), 201
 
@@ -352,11 +359,19 @@ def save_post(post_id):
 def get_saved_posts():
     current_user_id = get_jwt_identity()
     
-    saved = SavedPost.query.filter_by(user_id=current_user_id).order_by(SavedPost.created_at.desc()).all()
+    saved, meta = paginate(
+        SavedPost.query.filter_by(user_id=current_user_id).options(SavedPost.with_post()),
+        SavedPost,
+        **pagination_args(50)
+    )
+    hydrated = hydrate_posts([s.post for s in saved if s.post is not None])
     
     posts_data = []
     for s in saved:
         post = s.post
+        if post is None:
+            continue
+        author = hydrated[post.id]['author']
         posts_data.append({
             'id': post.id,
             'content': post.content,
@@ -365,34 +380,36 @@ def get_saved_posts():
             'saved_at': s.created_at.isoformat(),
             'collection': s.collection_name,
             'author': {
-                'id': post.author.id,
-                'username': post.author.username,
-                'first_name': post.author.first_name,
-                'last_name': post.author.last_name
+                'id': author['id'],
+                'username': author['username'],
+                'first_name': author['first_name'],
+                'last_name': author['last_name']
             }
         })
     
-    return jsonify({'saved_posts': posts_data}), 200
+    return jsonify(dict({'saved_posts': posts_data}, **meta)), 200
 
 @posts_bp.route('/trending', methods=['GET'])
 @jwt_required()
 def get_trending():
     week_ago = datetime.utcnow() - timedelta(days=7)
     
-    trending_posts = db.session.query(Post).join(Like).filter(Post.created_at >= week_ago).group_by(Post.id).order_by(db.func.count(Like.id).desc()).limit(10).all()
+    trending_posts = Post.query.options(Post.with_author()).filter(Post.created_at >= week_ago, Post.likes_count > 0).order_by(Post.likes_count.desc()).limit(10).all()
+    
+    hydrated = hydrate_posts(trending_posts)
     
     posts_data = [{
         'id': p.id,
         'content': p.content,
         'images': p.images,
         'author': {
-            'id': p.author.id,
-            'username': p.author.username,
-            'first_name': p.author.first_name,
-            'profile_picture': p.author.profile_picture
+            'id': hydrated[p.id]['author']['id'],
+            'username': hydrated[p.id]['author']['username'],
+            'first_name': hydrated[p.id]['author']['first_name'],
+            'profile_picture': hydrated[p.id]['author']['profile_picture']
         },
-        'likes_count': p.likes.count(),
-        'comments_count': p.comments.count(),
+        'likes_count': hydrated[p.id]['likes_count'],
+        'comments_count': hydrated[p.id]['comments_count'],
         'created_at': p.created_at.isoformat()
     } for p in trending_posts]
     
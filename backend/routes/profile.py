@@ -1,11 +1,16 @@
-import os
-import uuid
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from werkzeug.utils import secure_filename
-from ..models import User, Friendship
+from ..models import User
 from ..extensions import db
 from ..helpers import sanitize_content
+from ..presence import presence
+from ..search import search_index
+from ..typeahead import user_prefix_index
+from ..media import upload_from_request
+from ..storage import media_storage
+from ..graph import is_following, mutual_count, mutual_sample, mutual_users_query, friendship_between
+from ..feed import serialize_author
+from ..pagination import paginate, pagination_args
 
 profile_bp = Blueprint('profile', __name__)
 
@@ -14,15 +19,11 @@ profile_bp = Blueprint('profile', __name__)
 def get_profile(user_id):
     current_user_id = get_jwt_identity()
     user = User.query.get_or_404(user_id)
-    current_user = User.query.get(current_user_id)
     
-    is_friend = Friendship.query.filter(
-        ((Friendship.user_id == current_user_id) & (Friendship.friend_id == user_id)) |
-        ((Friendship.user_id == user_id) & (Friendship.friend_id == current_user_id)),
-        Friendship.status == 'accepted'
-    ).first() is not None
+    friendship = friendship_between(current_user_id, user_id)
+    is_friend = friendship is not None and friendship.status == 'accepted'
     
-    is_following = current_user.is_following(user)
+    is_online, last_seen = presence.status(user.id)
     
     return jsonify({
         'id': user.id,
@@ -34,22 +35,33 @@ def get_profile(user_id):
         'profile_picture': user.profile_picture,
         'cover_photo': user.cover_photo,
         'is_verified': user.is_verified,
-        'is_online': user.is_online,
-        'last_seen': user.last_seen.isoformat(),
+        'is_online': is_online,
+        'last_seen': (last_seen or user.last_seen).isoformat(),
         'location': user.location,
         'website': user.website,
         'relationship_status': user.relationship_status,
         'work': user.work,
         'education': user.education,
         'created_at': user.created_at.isoformat(),
-        'followers_count': user.followers.count(),
-        'following_count': user.following.count(),
-        'posts_count': user.posts.count(),
+        'followers_count': user.followers_count,
+        'following_count': user.following_count,
+        'posts_count': user.posts_count,
         'is_friend': is_friend,
-        'is_following': is_following,
-        'mutual_friends': len(set(current_user.following.all()) & set(user.following.all()))
+        'is_following': is_following(current_user_id, user_id),
+        'mutual_friends': mutual_count(current_user_id, user_id),
+        'mutual_friends_sample': [serialize_author(u) for u in mutual_sample(current_user_id, user_id)]
     }), 200
 
+@profile_bp.route('/profile/<int:user_id>/mutual-friends', methods=['GET'])
+@jwt_required()
+def get_mutual_friends(user_id):
+    current_user_id = get_jwt_identity()
+    User.query.get_or_404(user_id)
+    
+    users, meta = paginate(mutual_users_query(current_user_id, user_id), User, **pagination_args(20))
+    
+    return jsonify(dict({'mutual_friends': [serialize_author(u) for u in users]}, **meta)), 200
+
 @profile_bp.route('/profile', methods=['PUT'])
 @jwt_required()
 def update_profile():
@@ -69,7 +81,9 @@ def update_profile():
     if 'privacy_settings' in data:
         user.privacy_settings = data['privacy_settings']
     
+    search_index.index_user(user)
     db.session.commit()
+    user_prefix_index.update(user)
     
     return jsonify({'message': 'Your profile has been updated successfully!'}), 200
 
@@ -79,19 +93,26 @@ def upload_profile_picture():
     current_user_id = get_jwt_identity()
     user = User.query.get(current_user_id)
     
-    if 'file' not in request.files:
-        return jsonify({'message': 'No file uploaded'}), 400
-    
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify({'message': 'No file selected'}), 400
+    # Stores the 128px avatar; the 64/512 variants share its name with another size suffix
+    url, variants = upload_from_request('avatar')
+    media_storage.release([user.profile_picture])
+    media_storage.retain([url])
+    user.profile_picture = url
+    db.session.commit()
+    user_prefix_index.update(user)
     
-    filename = f"{uuid.uuid4()}_{secure_filename(file.filename)}"
-    filepath = os.path.join(current_app.config['UPLOAD_FOLDER'], 'profiles', filename)
-    file.save(filepath)
+    return jsonify({'message': 'Profile picture updated!', 'url': url, 'variants': variants}), 200
+
+@profile_bp.route('/upload/cover-photo', methods=['POST'])
+@jwt_required()
+def upload_cover_photo():
+    current_user_id = get_jwt_identity()
+    user = User.query.get(current_user_id)
     
-    # We store a web-accessible path, assuming /uploads is served
-    user.profile_picture = f'/uploads/profiles/{filename}'
+    url, variants = upload_from_request('cover')
+    media_storage.release([user.cover_photo])
+    media_storage.retain([url])
+    user.cover_photo = url
     db.session.commit()
     
-    return jsonify({'message': 'Profile picture updated!', 'url': user.profile_picture}), 200
\ No newline at end of file
+    return jsonify({'message': 'Cover photo updated!', 'url': url, 'variants': variants}), 200
\ No newline at end of file
@@ -1,8 +1,12 @@
 from flask import Blueprint, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from datetime import datetime
-from ..models import Story, User
+from ..models import Story, StoryView
 from ..extensions import db
+from ..media import upload_from_request
+from ..storage import media_storage
+from ..stories import active_stories_query, story_views
+from ..feed import serialize_author
+from ..pagination import paginate, pagination_args
 
 stories_bp = Blueprint('stories', __name__)
 
@@ -22,35 +26,30 @@ def create_story():
     )
     
     db.session.add(new_story)
+    media_storage.retain([new_story.media_url])
     db.session.commit()
     
     return jsonify({'message': 'Story published!', 'story_id': new_story.id}), 201
 
+@stories_bp.route('/upload/story-media', methods=['POST'])
+@jwt_required()
+def upload_story_media():
+    # The returned url is the media_url of POST /stories
+    url, variants = upload_from_request('story')
+    return jsonify({'url': url, 'variants': variants}), 201
+
 @stories_bp.route('/stories', methods=['GET'])
 @jwt_required()
 def get_stories():
     current_user_id = get_jwt_identity()
-    user = User.query.get(current_user_id)
-    
-    friends = [f.id for f in user.following.all()]
-    friends.append(current_user_id)
     
-    stories = Story.query.filter(
-        Story.user_id.in_(friends),
-        Story.expires_at > datetime.utcnow()
-    ).order_by(Story.created_at.desc()).all()
+    stories = active_stories_query(current_user_id).options(Story.with_author()).all()
     
     stories_by_user = {}
     for story in stories:
         if story.user_id not in stories_by_user:
             stories_by_user[story.user_id] = {
-                'user': {
-                    'id': story.author.id,
-                    'username': story.author.username,
-                    'first_name': story.author.first_name,
-                    'last_name': story.author.last_name,
-                    'profile_picture': story.author.profile_picture
-                },
+                'user': serialize_author(story.author),
                 'stories': []
             }
         
@@ -62,7 +61,7 @@ def get_stories():
             'background_color': story.background_color,
             'created_at': story.created_at.isoformat(),
             'expires_at': story.expires_at.isoformat(),
-            'views_count': len(story.views if story.views else []) # Handle None
+            'views_count': story.views_count
         })
     
     return jsonify({'stories': list(stories_by_user.values())}), 200
@@ -71,19 +70,29 @@ def get_stories():
 @jwt_required()
 def view_story(story_id):
     current_user_id = get_jwt_identity()
-    story = Story.query.get_or_404(story_id)
+    Story.query.get_or_404(story_id)
+    
+    # Written in a batch by the recorder; viewing twice is a no-op
+    story_views.record(story_id, current_user_id)
     
-    # Handle if story.views is None (though default is [])
-    if story.views is None:
-        story.views = []
+    return jsonify({'message': 'Story viewed'}), 200
 
-    if current_user_id not in story.views:
-        # This is tricky because JSON lists aren't mutable in-place like this.
-        # A more robust way:
-        current_views = list(story.views)
-        current_views.append(current_user_id)
-        story.views = current_views
-        
-        db.session.commit()
+@stories_bp.route('/stories/<int:story_id>/viewers', methods=['GET'])
+@jwt_required()
+def get_story_viewers(story_id):
+    current_user_id = get_jwt_identity()
+    story = Story.query.get_or_404(story_id)
+    
+    if story.user_id != current_user_id:
+        return jsonify({'message': 'Only the author can see who viewed a story'}), 403
+    
+    views, meta = paginate(
+        StoryView.query.filter_by(story_id=story_id).options(StoryView.with_viewer()),
+        StoryView,
+        **pagination_args(50)
+    )
     
-    return jsonify({'message': 'Story viewed'}), 200
\ No newline at end of file
+    return jsonify(dict({
+        'viewers': [dict(serialize_author(v.viewer), viewed_at=v.created_at.isoformat()) for v in views],
+        'views_count': story.views_count
+    }, **meta)), 200
\ No newline at end of file
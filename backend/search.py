@@ -0,0 +1,175 @@
+import re
+from sqlalchemy import event
+from .extensions import db
+from .models import User, Post
+from .pagination import paginate, encode_ranked_cursor, decode_ranked_cursor
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+def tokenize(query):
+    return TOKEN_RE.findall(query.lower())
+
+class SearchSchemaMissing(RuntimeError):
+    pass
+
+class LikeSearchBackend:
+    """Portable fallback that scans with ILIKE; used on databases without FTS5."""
+
+    def ensure_schema(self, connection):
+        pass
+
+    def has_schema(self, connection):
+        return True
+
+    def index_user(self, user):
+        pass
+
+    def index_post(self, post):
+        pass
+
+    def remove_post(self, post_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def search_users(self, query, cursor=None, limit=20):
+        users, meta = paginate(User.query.filter(
+            (User.username.ilike(f'%{query}%')) |
+            (User.first_name.ilike(f'%{query}%')) |
+            (User.last_name.ilike(f'%{query}%'))
+        ), User, cursor=cursor, per_page=limit)
+        return [u.id for u in users], meta['next_cursor']
+
+    def search_posts(self, query, cursor=None, limit=20):
+        posts, meta = paginate(Post.query.filter(Post.content.ilike(f'%{query}%')), Post, cursor=cursor, per_page=limit)
+        return [p.id for p in posts], meta['next_cursor']
+
+class SQLiteFTSBackend:
+    """
+    SQLite FTS5 index. user_fts and post_fts are keyed by rowid = User.id /
+    Post.id and written in the same transaction as the rows they mirror.
+    Every query token is a prefix match, so partial words work for typeahead,
+    and results are ordered by BM25 relevance.
+    """
+
+    def ensure_schema(self, connection):
+        connection.execute(db.text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS user_fts USING fts5(username, first_name, last_name)"
+        ))
+        connection.execute(db.text(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS post_fts USING fts5(content)"
+        ))
+
+    def has_schema(self, connection):
+        return connection.execute(db.text(
+            "SELECT count(*) FROM sqlite_master WHERE type = 'table' AND name IN ('user_fts', 'post_fts')"
+        )).scalar() == 2
+
+    def index_user(self, user):
+        db.session.execute(db.text("DELETE FROM user_fts WHERE rowid = :id"), {'id': user.id})
+        db.session.execute(db.text(
+            "INSERT INTO user_fts (rowid, username, first_name, last_name) VALUES (:id, :username, :first_name, :last_name)"
+        ), {'id': user.id, 'username': user.username, 'first_name': user.first_name or '', 'last_name': user.last_name or ''})
+
+    def index_post(self, post):
+        db.session.execute(db.text("DELETE FROM post_fts WHERE rowid = :id"), {'id': post.id})
+        db.session.execute(db.text(
+            "INSERT INTO post_fts (rowid, content) VALUES (:id, :content)"
+        ), {'id': post.id, 'content': post.content})
+
+    def remove_post(self, post_id):
+        db.session.execute(db.text("DELETE FROM post_fts WHERE rowid = :id"), {'id': post_id})
+
+    def rebuild(self):
+        db.session.execute(db.text("DELETE FROM user_fts"))
+        db.session.execute(db.text(
+            "INSERT INTO user_fts (rowid, username, first_name, last_name) "
+            "SELECT id, username, coalesce(first_name, ''), coalesce(last_name, '') FROM user"
+        ))
+        db.session.execute(db.text("DELETE FROM post_fts"))
+        db.session.execute(db.text("INSERT INTO post_fts (rowid, content) SELECT id, content FROM post"))
+
+    def _match(self, table, query, cursor, limit):
+        tokens = tokenize(query)
+        if not tokens:
+            return [], None
+
+        params = {'match': ' '.join(f'"{token}"*' for token in tokens), 'limit': limit + 1}
+        after = ''
+        if cursor:
+            params['rank'], params['after_id'] = decode_ranked_cursor(cursor)
+            after = f"AND (bm25({table}) > :rank OR (bm25({table}) = :rank AND rowid > :after_id))"
+
+        rows = db.session.execute(db.text(
+            f"SELECT rowid, bm25({table}) AS rank FROM {table} WHERE {table} MATCH :match {after} "
+            f"ORDER BY rank, rowid LIMIT :limit"
+        ), params).all()
+
+        next_cursor = encode_ranked_cursor(rows[limit - 1].rank, rows[limit - 1].rowid) if len(rows) > limit else None
+        return [row.rowid for row in rows[:limit]], next_cursor
+
+    def search_users(self, query, cursor=None, limit=20):
+        return self._match('user_fts', query, cursor, limit)
+
+    def search_posts(self, query, cursor=None, limit=20):
+        return self._match('post_fts', query, cursor, limit)
+
+class SearchIndex:
+    """Chooses a search backend from SEARCH_BACKEND ('auto', 'fts5' or 'like') and proxies to it."""
+
+    backends = {'fts5': SQLiteFTSBackend, 'like': LikeSearchBackend}
+
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = LikeSearchBackend()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        name = app.config['SEARCH_BACKEND']
+        if name == 'auto':
+            name = 'fts5' if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite') else 'like'
+        self.backend = self.backends[name]()
+        self._schema_ready = False
+        app.extensions['search_index'] = self
+
+        # db.create_all() (db_init.py) creates the index tables alongside the models
+        if not event.contains(db.metadata, 'after_create', _create_search_schema):
+            event.listen(db.metadata, 'after_create', _create_search_schema)
+
+    def _ready(self):
+        # The tables come from db.create_all() or rebuild-search-index, never from DDL in a
+        # request: a second connection would wait on the request's own SQLite write lock
+        if not self._schema_ready:
+            if not self.backend.has_schema(db.session.connection()):
+                raise SearchSchemaMissing('Search index tables are missing; run `flask --app run.py rebuild-search-index`.')
+            self._schema_ready = True
+        return self.backend
+
+    def index_user(self, user):
+        self._ready().index_user(user)
+
+    def index_post(self, post):
+        self._ready().index_post(post)
+
+    def remove_post(self, post_id):
+        self._ready().remove_post(post_id)
+
+    def rebuild(self):
+        self.backend.ensure_schema(db.session.connection())
+        self._schema_ready = True
+        self.backend.rebuild()
+        db.session.commit()
+
+    def search_users(self, query, cursor=None, limit=20):
+        return self._ready().search_users(query, cursor, limit)
+
+    def search_posts(self, query, cursor=None, limit=20):
+        return self._ready().search_posts(query, cursor, limit)
+
+search_index = SearchIndex()
+
+def _create_search_schema(target, connection, **kw):
+    search_index.backend.ensure_schema(connection)
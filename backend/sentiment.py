@@ -0,0 +1,123 @@
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from flask import has_request_context
+from .extensions import db, socketio
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+def polarity(text):
+    # TextBlob is slow to import, so only scoring processes ever load it
+    from textblob import TextBlob
+    return TextBlob(text).sentiment.polarity
+
+def polarities(texts):
+    return [polarity(text) for text in texts]
+
+def sentiment_label(score):
+    if score is None:
+        return 'pending'
+    return 'positive' if score > 0 else 'negative' if score < 0 else 'neutral'
+
+class SentimentScorer:
+    """
+    Scores Post.sentiment outside the request path. New and edited posts are
+    queued by id and scored in batches by a background task, which fans the
+    NLP work out to a pool of SENTIMENT_POOL_SIZE processes (0 scores inline).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pending = deque()
+        self._executor = None
+        self._worker_started = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['sentiment_scorer'] = self
+        app.after_request(self._flush_after_request)
+
+    def enqueue(self, post_id):
+        self._pending.append(post_id)
+
+        if not self.app.config['SENTIMENT_ASYNC']:
+            if not has_request_context():
+                self.flush()
+        elif not self._worker_started:
+            self._worker_started = True
+            socketio.start_background_task(self._run)
+
+    def _flush_after_request(self, response):
+        if not self.app.config['SENTIMENT_ASYNC'] and self._pending:
+            self.flush()
+        return response
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.app.config['SENTIMENT_FLUSH_INTERVAL'])
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Sentiment scoring failed')
+
+    def _polarities(self, contents):
+        pool_size = self.app.config['SENTIMENT_POOL_SIZE']
+        if not pool_size:
+            return polarities(contents)
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=pool_size)
+
+        chunk_size = max(1, len(contents) // (pool_size * 4))
+        futures = [self._executor.submit(polarities, contents[start:start + chunk_size])
+                   for start in range(0, len(contents), chunk_size)]
+        # Poll instead of blocking so other green threads keep running meanwhile
+        while not all(future.done() for future in futures):
+            socketio.sleep(0.01)
+        return [score for future in futures for score in future.result()]
+
+    def score_posts(self, post_ids):
+        """Scores the given posts with their current content and stores the results in one bulk UPDATE."""
+        rows = db.session.query(Post.id, Post.content).filter(Post.id.in_(post_ids)).all()
+        if not rows:
+            return 0
+        scores = self._polarities([content for _, content in rows])
+        db.session.execute(db.update(Post), [
+            {'id': post_id, 'sentiment': score} for (post_id, _), score in zip(rows, scores)
+        ])
+        db.session.commit()
+        return len(rows)
+
+    def flush(self):
+        while self._pending:
+            batch = set()
+            while self._pending and len(batch) < self.app.config['SENTIMENT_BATCH_SIZE']:
+                batch.add(self._pending.popleft())
+            try:
+                with self.app.app_context():
+                    self.score_posts(list(batch))
+            except Exception as error:
+                # Back in line for the next flush; the posts stay 'pending' until then
+                self._pending.extend(batch)
+                if isinstance(error, BrokenProcessPool):
+                    self._executor = None
+                raise
+
+    def backfill(self):
+        """Scores every post that has no sentiment yet, one batch at a time. Returns the number scored."""
+        scored = 0
+        last_id = 0
+        while True:
+            post_ids = [row[0] for row in db.session.query(Post.id).filter(
+                Post.sentiment.is_(None),
+                Post.id > last_id
+            ).order_by(Post.id).limit(self.app.config['SENTIMENT_BATCH_SIZE']).all()]
+            if not post_ids:
+                return scored
+            scored += self.score_posts(post_ids)
+            last_id = post_ids[-1]
+
+sentiment_scorer = SentimentScorer()
@@ -0,0 +1,71 @@
+import hashlib
+import os
+from collections import OrderedDict
+from flask import abort, current_app, request, send_file, url_for
+from werkzeug.security import safe_join
+from .storage import BLOB_URL_RE
+
+# Subfolders of UPLOAD_FOLDER served at /uploads: the blob store and the per-kind folders older uploads were saved to.
+# Everything else (tmp/ holds uploads still being processed) is not public.
+MEDIA_FOLDERS = ('blobs', 'profiles', 'posts', 'stories')
+
+# (path, mtime, size) -> digest, least recently used first
+_hashes = OrderedDict()
+
+def file_etag(path):
+    """SHA-256 of a file's content, recomputed only when its size or mtime changes."""
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+    digest = _hashes.get(key)
+    if digest is None:
+        hasher = hashlib.sha256()
+        with open(path, 'rb') as handle:
+            for chunk in iter(lambda: handle.read(64 * 1024), b''):
+                hasher.update(chunk)
+        digest = _hashes[key] = hasher.hexdigest()
+        while len(_hashes) > current_app.config['MEDIA_ETAG_CACHE_SIZE']:
+            _hashes.popitem(last=False)
+    _hashes.move_to_end(key)
+    return digest
+
+def send_media(filename):
+    """
+    Serves a file from one of the MEDIA_FOLDERS of UPLOAD_FOLDER. Uploaded
+    files never change under the same name, so responses are cacheable
+    forever. send_file answers
+    If-None-Match with 304 and Range requests (video seeking) with 206, and
+    hands the file to the server's sendfile / X-Sendfile when available.
+    """
+    folder, _, name = filename.partition('/')
+    if folder not in MEDIA_FOLDERS or not name:
+        abort(404)
+    path = safe_join(os.path.abspath(current_app.config['UPLOAD_FOLDER']), folder, name)
+    if path is None or not os.path.isfile(path):
+        abort(404)
+
+    # Blob file names already carry their content hash
+    if BLOB_URL_RE.search(f'/uploads/{filename}'):
+        etag = os.path.splitext(os.path.basename(path))[0]
+    else:
+        etag = file_etag(path)
+
+    response = send_file(path, conditional=True, etag=etag, max_age=current_app.config['MEDIA_MAX_AGE'])
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    return response
+
+def asset_url(filename):
+    """Static URL fingerprinted with the file's content hash, e.g. /static/js/main.js?v=3f2a9c1b04de."""
+    return url_for('static', filename=filename, v=file_etag(os.path.join(current_app.static_folder, filename))[:12])
+
+def _cache_fingerprinted_assets(response):
+    if request.endpoint == 'static' and 'v' in request.args and response.status_code in (200, 206, 304):
+        response.cache_control.no_cache = None
+        response.cache_control.public = True
+        response.cache_control.max_age = current_app.config['MEDIA_MAX_AGE']
+        response.cache_control.immutable = True
+    return response
+
+def register_static_assets(app):
+    app.add_template_global(asset_url)
+    app.after_request(_cache_fingerprinted_assets)
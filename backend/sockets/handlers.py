@@ -1,34 +1,57 @@
-from backend.extensions import socketio, db
+from flask import request
+from backend.extensions import db, socketio
 from backend.models import User
+from backend.presence import presence
 from flask_socketio import emit, join_room, leave_room
-from datetime import datetime
+
+# socket id -> user id, so a dropped connection can be marked offline
+connected_users = {}
 
 @socketio.on('connect')
 def handle_connect():
     print('Client connected')
 
+def _user_id(data):
+    # Ids arrive straight from the client
+    user_id = data.get('user_id') if isinstance(data, dict) else None
+    return user_id if isinstance(user_id, int) and not isinstance(user_id, bool) else None
+
 @socketio.on('join')
 def handle_join(data):
-    room = f'user_{data["user_id"]}'
-    join_room(room)
-    user = User.query.get(data['user_id'])
-    if user:
-        user.is_online = True
-        db.session.commit()
+    user_id = _user_id(data)
+    if user_id is None or db.session.get(User, user_id) is None:
+        return
+    join_room(f'user_{user_id}')
+    connected_users[request.sid] = user_id
+    presence.heartbeat(user_id)
+
+@socketio.on('heartbeat')
+def handle_heartbeat(data):
+    # Only for the user this connection joined as, which was checked once in handle_join
+    user_id = connected_users.get(request.sid)
+    if user_id is not None and user_id == _user_id(data):
+        presence.heartbeat(user_id)
 
 @socketio.on('leave')
 def handle_leave(data):
-    room = f'user_{data["user_id"]}'
-    leave_room(room)
-    user = User.query.get(data['user_id'])
-    if user:
-        user.is_online = False
-        user.last_seen = datetime.utcnow()
-        db.session.commit()
+    user_id = connected_users.get(request.sid)
+    if user_id is None or user_id != _user_id(data):
+        return
+    leave_room(f'user_{user_id}')
+    connected_users.pop(request.sid, None)
+    if user_id not in connected_users.values():
+        presence.disconnect(user_id)
+
+@socketio.on('disconnect')
+def handle_disconnect(*args):
+    user_id = connected_users.pop(request.sid, None)
+    # Another tab may still be connected for the same user
+    if user_id is not None and user_id not in connected_users.values():
+        presence.disconnect(user_id)
 
 @socketio.on('typing')
 def handle_typing(data):
     socketio.emit('user_typing', {
         'user_id': data['user_id'],
         'is_typing': data['is_typing']
-    }, room=f'user_{data["receiver_id"]}')
\ No newline at end of file
+    }, room=f'user_{data["receiver_id"]}')
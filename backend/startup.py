@@ -0,0 +1,51 @@
+import os
+import subprocess
+import sys
+
+# NLP and moderation libraries that must only be imported on first use
+LAZY_MODULES = ('textblob', 'nltk', 'bleach', 'profanity_check', 'sklearn', 'emoji', 'PIL')
+
+STARTUP_PROBE = """
+import sys, time
+started = time.perf_counter()
+from backend import create_app
+create_app()
+print(time.perf_counter() - started)
+print(' '.join(m for m in {lazy!r} if m in sys.modules))
+"""
+
+def _run_probe(project_root, *python_args):
+    return subprocess.run(
+        [sys.executable, *python_args, '-c', STARTUP_PROBE.format(lazy=LAZY_MODULES)],
+        cwd=project_root, capture_output=True, text=True, check=True
+    )
+
+def profile_imports(project_root, top=25):
+    """
+    Runs create_app() in a fresh interpreter under `python -X importtime`
+    and returns the `top` slowest imports as (cumulative_us, self_us, module).
+    """
+    result = _run_probe(project_root, '-X', 'importtime')
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        timings.append((int(cumulative_us), int(self_us), module.strip()))
+    return sorted(timings, reverse=True)[:top]
+
+def measure_startup(project_root, runs=3):
+    """
+    Times import + create_app() in `runs` fresh interpreters. Returns the
+    sorted timings in seconds and the lazy modules that were loaded eagerly.
+    """
+    timings = []
+    eager = set()
+    for _ in range(runs):
+        lines = _run_probe(project_root).stdout.splitlines()
+        timings.append(float(lines[-2]))
+        eager.update(lines[-1].split())
+    return sorted(timings), sorted(eager)
+
+def project_root(app):
+    return os.path.dirname(app.root_path)
@@ -0,0 +1,143 @@
+import os
+import re
+from collections import Counter
+from datetime import datetime, timedelta
+from sqlalchemy.exc import IntegrityError
+from .extensions import db
+from .models import MediaBlob, User, Group, Post, Comment, Story, Message
+
+# Blob keys are '<sha256 of the upload>-<kind>', e.g. '9f86...0f00-avatar'
+BLOB_URL_RE = re.compile(r'/uploads/blobs/[0-9a-f]{2}/[0-9a-f]{2}/([0-9a-f]{64}-[a-z]+)_\w+\.jpg$')
+
+def blob_key(url):
+    match = BLOB_URL_RE.search(url) if url else None
+    return match.group(1) if match else None
+
+class LocalBlobStore:
+    """Variant files on the local disk under <root>/ab/cd/<key>_<variant>.jpg (two shard levels keep directories small)."""
+
+    url_prefix = '/uploads/blobs'
+
+    def __init__(self, root):
+        self.root = root
+
+    def _directory(self, key):
+        return os.path.join(self.root, key[:2], key[2:4])
+
+    def url(self, key, variant):
+        return f'{self.url_prefix}/{key[:2]}/{key[2:4]}/{key}_{variant}.jpg'
+
+    def exists(self, key, variants):
+        return all(os.path.exists(os.path.join(self._directory(key), f'{key}_{variant}.jpg')) for variant in variants)
+
+    def put(self, key, files):
+        """Moves rendered {variant: path} files into place; returns their total size in bytes."""
+        directory = self._directory(key)
+        os.makedirs(directory, exist_ok=True)
+        size = 0
+        for variant, path in files.items():
+            size += os.path.getsize(path)
+            os.replace(path, os.path.join(directory, f'{key}_{variant}.jpg'))
+        return size
+
+    def delete(self, key):
+        directory = self._directory(key)
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.startswith(f'{key}_'):
+                    os.remove(os.path.join(directory, name))
+
+class MediaStorage:
+    """
+    Content-addressed media storage. Identical uploads share one blob, and
+    MediaBlob.refcount tracks how many rows point at it. Routes retain and
+    release references as they change; collect_garbage() recounts them from
+    the tables and deletes blobs nothing references anymore.
+    """
+
+    backends = {'local': LocalBlobStore}
+
+    def __init__(self, app=None):
+        self.app = None
+        self.backend = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self.backend = self.backends[app.config['MEDIA_STORAGE_BACKEND']](
+            os.path.join(app.config['UPLOAD_FOLDER'], 'blobs')
+        )
+        app.extensions['media_storage'] = self
+
+    def has(self, key, variants):
+        return MediaBlob.query.filter_by(key=key).first() is not None and self.backend.exists(key, variants)
+
+    def store(self, key, files):
+        size = self.backend.put(key, files)
+        if MediaBlob.query.filter_by(key=key).first() is None:
+            db.session.add(MediaBlob(key=key, size=size))
+            try:
+                db.session.commit()
+            except IntegrityError:
+                # The same content was stored concurrently
+                db.session.rollback()
+
+    def urls(self, key, variants):
+        return {variant: self.backend.url(key, variant) for variant in variants}
+
+    def _adjust(self, urls, delta):
+        for key, count in Counter(filter(None, map(blob_key, urls))).items():
+            change = count * delta
+            db.session.execute(db.update(MediaBlob).where(MediaBlob.key == key).values(
+                refcount=db.case((MediaBlob.refcount + change > 0, MediaBlob.refcount + change), else_=0)
+            ))
+
+    def retain(self, urls):
+        """Counts new references to blob URLs (other URLs are ignored); committed with the caller's transaction."""
+        self._adjust(urls, 1)
+
+    def release(self, urls):
+        self._adjust(urls, -1)
+
+    def referenced_keys(self):
+        counts = Counter()
+        for column in (User.profile_picture, User.cover_photo, Group.cover_photo, Story.media_url, Comment.image, Message.image):
+            for (url,) in db.session.query(column).filter(column.like(f'{self.backend.url_prefix}/%')).yield_per(1000):
+                counts[blob_key(url)] += 1
+        for (images,) in db.session.query(Post.images).yield_per(1000):
+            counts.update(filter(None, map(blob_key, images or [])))
+        counts.pop(None, None)
+        return counts
+
+    def collect_garbage(self, grace):
+        """
+        Resets every refcount from the tables, then deletes unreferenced blobs
+        older than `grace` seconds (younger ones may belong to an upload whose
+        post is still being written). Returns (blobs deleted, bytes freed).
+        """
+        counts = self.referenced_keys()
+        cutoff = datetime.utcnow() - timedelta(seconds=grace)
+
+        changed = []
+        garbage = []
+        for blob_id, key, refcount, size, created_at in db.session.query(
+            MediaBlob.id, MediaBlob.key, MediaBlob.refcount, MediaBlob.size, MediaBlob.created_at
+        ).all():
+            if not counts[key] and created_at < cutoff:
+                garbage.append((blob_id, key, size))
+            elif counts[key] != refcount:
+                changed.append({'id': blob_id, 'refcount': counts[key]})
+
+        if changed:
+            db.session.execute(db.update(MediaBlob), changed)
+        if garbage:
+            db.session.execute(db.delete(MediaBlob).where(MediaBlob.id.in_([blob_id for blob_id, _, _ in garbage])))
+        db.session.commit()
+
+        # Rows go first: a failed commit must not leave rows pointing at deleted files
+        for _, key, _ in garbage:
+            self.backend.delete(key)
+        return len(garbage), sum(size for _, _, size in garbage)
+
+media_storage = MediaStorage()
@@ -0,0 +1,159 @@
+import logging
+from datetime import datetime
+from importlib import import_module
+from flask import has_request_context
+from .extensions import db, socketio
+from .models import Story, StoryView, User, followers
+from .storage import media_storage
+
+logger = logging.getLogger(__name__)
+
+def active_stories_query(viewer_id):
+    """Live stories of the viewer and everyone they follow, served by ix_story_author_expires."""
+    authors = db.select(followers.c.followed_id).where(followers.c.follower_id == viewer_id).union(
+        db.select(db.literal(viewer_id))
+    )
+    return Story.query.filter(
+        Story.user_id.in_(authors),
+        Story.expires_at > datetime.utcnow()
+    ).order_by(Story.created_at.desc())
+
+def sweep_expired_stories(batch_size):
+    """Deletes one batch of expired stories and releases their media. Returns the number deleted."""
+    expired = db.session.query(Story.id, Story.media_url).filter(
+        Story.expires_at <= datetime.utcnow()
+    ).order_by(Story.expires_at).limit(batch_size).all()
+    if not expired:
+        return 0
+
+    story_ids = [story_id for story_id, _ in expired]
+    media_storage.release([media_url for _, media_url in expired])
+    db.session.execute(db.delete(StoryView).where(StoryView.story_id.in_(story_ids)))
+    db.session.execute(db.delete(Story).where(Story.id.in_(story_ids)))
+    db.session.commit()
+    return len(expired)
+
+class StorySweeper:
+    """
+    Deletes expired stories every STORY_SWEEP_INTERVAL seconds, in batches of
+    STORY_SWEEP_BATCH_SIZE so no single transaction holds the table for long.
+    Their media is released to the blob store, where `flask gc-media` reclaims it.
+    The server entry point starts the loop (see start_background_tasks);
+    STORY_SWEEP_INTERVAL=0 disables it.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._started = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['story_sweeper'] = self
+
+    def start(self):
+        if not self._started and self.app.config['STORY_SWEEP_INTERVAL']:
+            self._started = True
+            socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.app.config['STORY_SWEEP_INTERVAL'])
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception('Story sweep failed')
+
+    def sweep(self):
+        deleted = 0
+        with self.app.app_context():
+            while True:
+                batch = sweep_expired_stories(self.app.config['STORY_SWEEP_BATCH_SIZE'])
+                deleted += batch
+                if batch < self.app.config['STORY_SWEEP_BATCH_SIZE']:
+                    return deleted
+                socketio.sleep(0)
+
+story_sweeper = StorySweeper()
+
+def insert_story_views(views):
+    """
+    Inserts (story_id, user_id) views, ignoring ones already recorded, then
+    refreshes views_count for the stories involved. Safe to repeat.
+    """
+    # Stories may have been swept (or users deleted) since the view was buffered
+    live = set(db.session.scalars(db.select(Story.id).where(Story.id.in_({story_id for story_id, _ in views}))))
+    users = set(db.session.scalars(db.select(User.id).where(User.id.in_({user_id for _, user_id in views}))))
+    rows = [{'story_id': story_id, 'user_id': user_id} for story_id, user_id in views if story_id in live and user_id in users]
+    if not rows:
+        return
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        insert = import_module(f'sqlalchemy.dialects.{dialect}').insert
+        db.session.execute(insert(StoryView).on_conflict_do_nothing(index_elements=['story_id', 'user_id']), rows)
+    else:
+        existing = set(db.session.query(StoryView.story_id, StoryView.user_id).filter(StoryView.story_id.in_(live)).all())
+        db.session.add_all(StoryView(**row) for row in rows if (row['story_id'], row['user_id']) not in existing)
+
+    db.session.execute(db.update(Story).where(Story.id.in_(live)).values(views_count=db.select(
+        db.func.count(StoryView.id)
+    ).where(StoryView.story_id == Story.id).scalar_subquery()))
+    db.session.commit()
+
+class StoryViewRecorder:
+    """
+    Buffers story views and writes them in one batch, either every
+    STORY_VIEW_FLUSH_INTERVAL seconds or after the request in synchronous
+    mode. Repeated views of the same story by the same user coalesce in
+    the buffer, and the unique (story_id, user_id) constraint drops the rest.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pending = set()
+        self._worker_started = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['story_views'] = self
+        app.after_request(self._flush_after_request)
+
+    def record(self, story_id, user_id):
+        self._pending.add((story_id, user_id))
+
+        if not self.app.config['STORY_VIEWS_ASYNC']:
+            if not has_request_context():
+                self.flush()
+        elif not self._worker_started:
+            self._worker_started = True
+            socketio.start_background_task(self._run)
+
+    def _flush_after_request(self, response):
+        if not self.app.config['STORY_VIEWS_ASYNC'] and self._pending:
+            self.flush()
+        return response
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.app.config['STORY_VIEW_FLUSH_INTERVAL'])
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Story view flush failed')
+
+    def flush(self):
+        if not self._pending:
+            return
+        pending, self._pending = self._pending, set()
+        try:
+            with self.app.app_context():
+                insert_story_views(pending)
+        except Exception:
+            self._pending |= pending
+            raise
+
+story_views = StoryViewRecorder()
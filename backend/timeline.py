@@ -0,0 +1,221 @@
+import logging
+from flask import current_app, has_request_context
+from .extensions import db, socketio
+from .models import Post, TimelineEntry, User, followers
+from .pagination import decode_cursor, encode_cursor
+
+logger = logging.getLogger(__name__)
+
+# Hybrid home timeline: posts by authors with at most TIMELINE_FANOUT_MAX_FOLLOWERS
+# followers are pushed onto each follower's TimelineEntry rows when created
+# (fan-out-on-write). Everything else (large accounts, or posts written while
+# fan-out was disabled) keeps Post.fanned_out = False and is pulled at read time.
+# Timelines hold at most TIMELINE_MAX_LENGTH entries; older posts are pulled too.
+
+def fanout_enabled():
+    return current_app.config.get('TIMELINE_FANOUT_ENABLED', False)
+
+def _following(user_id):
+    return db.select(followers.c.followed_id).where(followers.c.follower_id == user_id)
+
+def fan_out_post(post):
+    """Pushes a freshly created post onto its author's and followers' timelines."""
+    if not fanout_enabled():
+        return
+
+    follower_count = db.session.scalar(db.select(User.followers_count).where(User.id == post.user_id))
+    if follower_count > current_app.config['TIMELINE_FANOUT_MAX_FOLLOWERS']:
+        return
+
+    recipients = [post.user_id] + [row[0] for row in db.session.query(followers.c.follower_id).filter(
+        followers.c.followed_id == post.user_id
+    ).all()]
+
+    db.session.execute(db.insert(TimelineEntry), [{
+        'user_id': recipient_id,
+        'post_id': post.id,
+        'author_id': post.user_id,
+        'created_at': post.created_at
+    } for recipient_id in recipients])
+    post.fanned_out = True
+    timeline_trimmer.mark(recipients)
+
+def trim_timelines(user_ids):
+    """Drops entries beyond TIMELINE_MAX_LENGTH from the given users' timelines."""
+    ranked = db.select(
+        TimelineEntry.id,
+        db.func.row_number().over(
+            partition_by=TimelineEntry.user_id,
+            order_by=(TimelineEntry.created_at.desc(), TimelineEntry.post_id.desc())
+        ).label('position')
+    ).where(TimelineEntry.user_id.in_(user_ids)).subquery()
+
+    db.session.execute(db.delete(TimelineEntry).where(TimelineEntry.id.in_(
+        db.select(ranked.c.id).where(ranked.c.position > current_app.config['TIMELINE_MAX_LENGTH'])
+    )))
+
+def backfill_timeline(user_id, author_id):
+    """Copies an author's recent fanned-out posts into a new follower's timeline."""
+    if not fanout_enabled():
+        return
+
+    already_present = db.select(TimelineEntry.post_id).where(TimelineEntry.user_id == user_id)
+    recent_posts = db.select(
+        db.literal(user_id), Post.id, Post.user_id, Post.created_at
+    ).where(
+        Post.user_id == author_id,
+        Post.fanned_out == True,
+        Post.id.not_in(already_present)
+    ).order_by(Post.created_at.desc()).limit(current_app.config['TIMELINE_MAX_LENGTH'])
+
+    db.session.execute(db.insert(TimelineEntry).from_select(
+        ['user_id', 'post_id', 'author_id', 'created_at'], recent_posts
+    ))
+    timeline_trimmer.mark([user_id])
+
+def remove_author_from_timeline(user_id, author_id):
+    """Removes an author's posts from a user's timeline, e.g. after an unfollow."""
+    TimelineEntry.query.filter_by(user_id=user_id, author_id=author_id).delete(synchronize_session=False)
+
+def remove_post_from_timelines(post_id):
+    TimelineEntry.query.filter_by(post_id=post_id).delete(synchronize_session=False)
+
+def timeline_query(user_id):
+    """Every post visible on a user's home timeline, newest first (the pull-only read)."""
+    return Post.query.filter(
+        (Post.user_id == user_id) | Post.user_id.in_(_following(user_id))
+    ).order_by(Post.created_at.desc())
+
+def _before(created_at_column, id_column, cursor):
+    created_at, row_id = cursor
+    return (created_at_column < created_at) | ((created_at_column == created_at) & (id_column < row_id))
+
+def _pushed_rows(user_id, cursor, limit):
+    """(created_at, post_id) from the user's TimelineEntry rows, a seek on ix_timeline_user_created."""
+    query = db.select(TimelineEntry.created_at, TimelineEntry.post_id).where(TimelineEntry.user_id == user_id)
+    if cursor:
+        query = query.where(_before(TimelineEntry.created_at, TimelineEntry.post_id, cursor))
+    return db.session.execute(query.order_by(
+        TimelineEntry.created_at.desc(), TimelineEntry.post_id.desc()
+    ).limit(limit)).all()
+
+def _unpushed_authors(user_id):
+    """The viewer and followed authors too large to fan out, whose new posts are never pushed."""
+    return db.select(User.id).where(
+        User.id.in_(_following(user_id).union(db.select(db.literal(user_id)))),
+        User.followers_count > current_app.config['TIMELINE_FANOUT_MAX_FOLLOWERS']
+    )
+
+def _pulled_rows(condition, cursor, limit):
+    query = db.select(Post.created_at, Post.id).where(condition)
+    if cursor:
+        query = query.where(_before(Post.created_at, Post.id, cursor))
+    return db.session.execute(query.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit)).all()
+
+def timeline_page(user_id, cursor=None, page=None, per_page=10, include_total=False):
+    """
+    One page of the fan-out timeline, same (items, meta) contract as paginate().
+    The page is read from the user's TimelineEntry rows and merged with the
+    posts of authors too large to fan out (ix_post_fanout_author). Only once
+    the timeline runs out (it was trimmed or predates fan-out) are the
+    remaining older posts pulled from every followed author.
+    """
+    meta = {}
+    if cursor:
+        cursor = decode_cursor(cursor)
+        offset = 0
+    else:
+        page = max(page or 1, 1)
+        offset = (page - 1) * per_page
+        meta.update({'current_page': page, 'has_prev': page > 1})
+    limit = offset + per_page + 1
+
+    pushed = _pushed_rows(user_id, cursor, limit)
+    rows = list(pushed) + _pulled_rows(
+        (Post.fanned_out == False) & Post.user_id.in_(_unpushed_authors(user_id)), cursor, limit
+    )
+    if len(pushed) < limit:
+        if pushed:
+            oldest = pushed[-1].created_at
+        else:
+            oldest = db.session.scalar(db.select(db.func.min(TimelineEntry.created_at)).where(TimelineEntry.user_id == user_id))
+        authors = (Post.user_id == user_id) | Post.user_id.in_(_following(user_id))
+        rows += _pulled_rows(authors & (Post.created_at < oldest) if oldest else authors, cursor, limit)
+
+    # Newest first on (created_at, id); a post found by two sources counts once
+    post_ids = [post_id for _, post_id in sorted({(row[0], row[1]) for row in rows}, reverse=True)][offset:limit]
+
+    found = {post.id: post for post in Post.query.options(Post.with_author()).filter(Post.id.in_(post_ids)).all()}
+    posts = [found[post_id] for post_id in post_ids if post_id in found]
+    items = posts[:per_page]
+    has_next = len(posts) > per_page
+
+    meta.update({
+        'per_page': per_page,
+        'has_next': has_next,
+        'next_cursor': encode_cursor(items[-1]) if has_next else None
+    })
+    if include_total:
+        total = timeline_query(user_id).order_by(None).count()
+        meta.update({'total': total, 'pages': -(-total // per_page)})
+    return items, meta
+
+class TimelineTrimmer:
+    """
+    Trims timelines back to TIMELINE_MAX_LENGTH outside the request that
+    grew them. Fan-out marks its recipients and they are trimmed in batches
+    of TIMELINE_TRIM_BATCH_SIZE every TIMELINE_TRIM_INTERVAL seconds, or
+    after the request in synchronous mode. Marks are per process, so a
+    restart can leave a timeline a little long until its next fan-out.
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._pending = set()
+        self._worker_started = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        app.extensions['timeline_trimmer'] = self
+        app.after_request(self._flush_after_request)
+
+    def mark(self, user_ids):
+        self._pending.update(user_ids)
+
+        if not self.app.config['TIMELINE_TRIM_ASYNC']:
+            if not has_request_context():
+                self.flush()
+        elif not self._worker_started:
+            self._worker_started = True
+            socketio.start_background_task(self._run)
+
+    def _flush_after_request(self, response):
+        if not self.app.config['TIMELINE_TRIM_ASYNC'] and self._pending:
+            self.flush()
+        return response
+
+    def _run(self):
+        while True:
+            socketio.sleep(self.app.config['TIMELINE_TRIM_INTERVAL'])
+            try:
+                self.flush()
+            except Exception:
+                logger.exception('Timeline trim failed')
+
+    def flush(self):
+        while self._pending:
+            batch = set()
+            while self._pending and len(batch) < self.app.config['TIMELINE_TRIM_BATCH_SIZE']:
+                batch.add(self._pending.pop())
+            try:
+                with self.app.app_context():
+                    trim_timelines(list(batch))
+                    db.session.commit()
+            except Exception:
+                self._pending |= batch
+                raise
+            socketio.sleep(0)
+
+timeline_trimmer = TimelineTrimmer()
@@ -0,0 +1,165 @@
+import logging
+import threading
+import time
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from .extensions import db, socketio
+from .models import User
+from .graph import graph_cache
+from .search import tokenize
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_COLUMNS = (User.id, User.username, User.first_name, User.last_name, User.profile_picture, User.is_verified)
+
+class UserPrefixIndex:
+    """
+    Process-local typeahead index over username and name tokens. Tokens live
+    in one sorted list of (token, user_id) pairs, so a prefix lookup is a
+    bisect plus a short scan and needs no database round trip. Writes in
+    this process update it incrementally; a background task started by the
+    server (see start_background_tasks) builds it and reloads it every
+    TYPEAHEAD_REFRESH_INTERVAL seconds to pick up writes from other workers.
+    With the interval set to 0 it is built on first use instead (tests).
+    """
+
+    def __init__(self, app=None):
+        self.app = None
+        self._lock = threading.Lock()
+        self._entries = []
+        self._users = {}
+        self._loaded_at = None
+        self._circles = OrderedDict()
+        self._started = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.app = app
+        self._users, self._entries, self._loaded_at = {}, [], None
+        self._circles = OrderedDict()
+        app.extensions['user_prefix_index'] = self
+
+    def start(self):
+        if not self._started and self.app.config['TYPEAHEAD_REFRESH_INTERVAL']:
+            self._started = True
+            socketio.start_background_task(self._run)
+
+    def _run(self):
+        while True:
+            try:
+                with self.app.app_context():
+                    if not self.load():
+                        logger.info('Typeahead index not built yet: the user table does not exist')
+            except Exception:
+                logger.exception('Typeahead index load failed')
+            socketio.sleep(self.app.config['TYPEAHEAD_REFRESH_INTERVAL'])
+
+    def _tokens(self, user):
+        return set(tokenize(' '.join(filter(None, [user['username'], user['first_name'], user['last_name']]))))
+
+    def _snapshot(self, user):
+        return {
+            'id': user.id,
+            'username': user.username,
+            'first_name': user.first_name,
+            'last_name': user.last_name,
+            'profile_picture': user.profile_picture,
+            'is_verified': user.is_verified
+        }
+
+    def load(self):
+        """Builds the index from the user table. Returns False, leaving it unloaded, if the table does not exist yet."""
+        if not db.inspect(db.session.connection()).has_table(User.__tablename__):
+            return False
+        # Plain column rows: no ORM identity map for the whole user table
+        users = {row.id: row._asdict() for row in db.session.execute(db.select(*SNAPSHOT_COLUMNS)).yield_per(1000)}
+        entries = sorted((token, user_id) for user_id, user in users.items() for token in self._tokens(user))
+        with self._lock:
+            self._users, self._entries = users, entries
+            self._loaded_at = time.monotonic()
+        return True
+
+    def update(self, user):
+        """Re-indexes one user after registration or a profile edit."""
+        if self._loaded_at is None:
+            return
+        snapshot = self._snapshot(user)
+        with self._lock:
+            previous = self._users.get(user.id)
+            if previous is not None:
+                for token in self._tokens(previous):
+                    position = bisect_left(self._entries, (token, user.id))
+                    if position < len(self._entries) and self._entries[position] == (token, user.id):
+                        del self._entries[position]
+            for token in self._tokens(snapshot):
+                insort(self._entries, (token, user.id))
+            self._users[user.id] = snapshot
+
+    def _prefix_matches(self, prefix):
+        position = bisect_left(self._entries, (prefix,))
+        while position < len(self._entries) and self._entries[position][0].startswith(prefix):
+            yield self._entries[position][1]
+            position += 1
+
+    def _circle(self, viewer_id):
+        """The viewer's followed users and friends-of-friends, cached briefly per viewer."""
+        cached = self._circles.get(viewer_id)
+        if cached is not None and cached[0] > time.monotonic():
+            self._circles.move_to_end(viewer_id)
+            return cached[1], cached[2]
+
+        followed = graph_cache.following(viewer_id)
+        following = set(followed)
+        friends_of_friends = set()
+        for adjacency in graph_cache.following_many(followed[:self.app.config['TYPEAHEAD_MAX_EXPANDED']]).values():
+            friends_of_friends.update(adjacency)
+            if len(friends_of_friends) >= self.app.config['TYPEAHEAD_MAX_CIRCLE']:
+                break
+        friends_of_friends -= following | {viewer_id}
+
+        self._circles[viewer_id] = (time.monotonic() + self.app.config['TYPEAHEAD_CIRCLE_TTL'], following, friends_of_friends)
+        self._circles.move_to_end(viewer_id)
+        while len(self._circles) > self.app.config['TYPEAHEAD_CIRCLE_CACHE_SIZE']:
+            self._circles.popitem(last=False)
+        return following, friends_of_friends
+
+    def _database_matches(self, tokens, limit):
+        # Only until the background load finishes: a plain prefix query on the first token
+        pattern = f'{tokens[0]}%'
+        rows = db.session.execute(db.select(*SNAPSHOT_COLUMNS).where(
+            User.username.ilike(pattern) | User.first_name.ilike(pattern) | User.last_name.ilike(pattern)
+        ).limit(limit * 4)).all()
+        users = [row._asdict() for row in rows]
+        return [user for user in users if all(any(t.startswith(token) for t in self._tokens(user)) for token in tokens)]
+
+    def suggest(self, query, viewer_id=None, limit=8):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        if self._loaded_at is None and not self.app.config['TYPEAHEAD_REFRESH_INTERVAL']:
+            self.load()
+
+        if self._loaded_at is None:
+            users = self._database_matches(tokens, limit)
+        else:
+            with self._lock:
+                candidates = set(self._prefix_matches(tokens[0]))
+                for token in tokens[1:]:
+                    candidates &= set(self._prefix_matches(token))
+                users = [self._users[user_id] for user_id in candidates]
+
+        following, friends_of_friends = self._circle(viewer_id) if viewer_id is not None else (set(), set())
+
+        def rank(user):
+            if user['id'] in following:
+                circle = 0
+            elif user['id'] in friends_of_friends:
+                circle = 1
+            else:
+                circle = 2
+            return (circle, user['username'].lower() != query.lower(), len(user['username']), user['id'])
+
+        return sorted(users, key=rank)[:limit]
+
+user_prefix_index = UserPrefixIndex()
@@ -4,6 +4,9 @@ let authToken = localStorage.getItem('authToken');
 let currentUser = JSON.parse(localStorage.getItem('currentUser') || '{}');
 // Connect to the same server that's serving the file
 let socket = io();
+// Presence heartbeats keep us "online"; the server expires silent clients
+const HEARTBEAT_INTERVAL_MS = 30000;
+let heartbeatTimer = null;
 
 function showNotification(message, type = 'success') {
     const notif = document.createElement('div');
@@ -158,6 +161,11 @@ function initializeApp() {
 }
 
 function connectSocket() {
+    clearInterval(heartbeatTimer);
+    heartbeatTimer = setInterval(() => {
+        if (socket.connected) socket.emit('heartbeat', { user_id: currentUser.id });
+    }, HEARTBEAT_INTERVAL_MS);
+    
     if (socket.connected) {
         socket.emit('join', { user_id: currentUser.id });
         return;
@@ -176,6 +184,12 @@ function connectSocket() {
         loadNotifications();
     });
     
+    // Several notifications for us were delivered in one batch
+    socket.on('new_notifications', (data) => {
+        showNotification(`You have ${data.notifications.length} new notifications`);
+        loadNotifications();
+    });
+    
     socket.on('new_message', (data) => {
         showNotification(`New message from ${data.sender.first_name}`);
         updateMessageBadge();
@@ -560,9 +574,9 @@ async function loadOnlineFriends() {
 
 async function loadNotifications() {
     try {
-        const data = await apiRequest('/notifications');
+        const data = await apiRequest('/notifications/unread-count');
         const badge = document.getElementById('notificationBadge');
-        const unread = data.notifications.filter(n => !n.is_read).length;
+        const unread = data.unread_count;
         
         if (unread > 0) {
             badge.style.display = 'flex';
@@ -1,11 +1,24 @@
-import os
-from backend import create_app, socketio
-# from pyngrok import ngrok  <-- No longer needed
+# The server runs on eventlet green threads (and talks to a Socket.IO message
+# queue from them), so the standard library must be patched before anything else is imported.
+# `flask --app run.py <command>` has imported Flask before this file, too late to patch
+# cleanly; its one-shot commands do not need green threads, so they run unpatched.
+import sys
+import eventlet
+serving = 'flask' not in sys.modules
+if serving:
+    eventlet.monkey_patch()
+
 from dotenv import load_dotenv
 
 load_dotenv()
 
+from backend import create_app, start_background_tasks, socketio
+# from pyngrok import ngrok  <-- No longer needed
+
 app = create_app()
+if serving:
+    # Server processes only (python run.py, gunicorn run:app), never CLI commands
+    start_background_tasks(app)
 
 if __name__ == '__main__':
     # --- All ngrok lines are removed ---
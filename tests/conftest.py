@@ -0,0 +1,53 @@
+import pytest
+from flask_jwt_extended import create_access_token
+from backend import create_app, db
+from backend.config import Config
+
+class TestConfig(Config):
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite://'
+    JWT_VERIFY_SUB = False
+    RATELIMIT_ENABLED = False
+    MAX_QUERIES_PER_REQUEST = 30
+    # Background work runs inline so tests see its writes
+    NOTIFICATION_OUTBOX_ASYNC = False
+    SENTIMENT_ASYNC = False
+    SENTIMENT_POOL_SIZE = 0
+    MEDIA_POOL_SIZE = 0
+    STORY_VIEWS_ASYNC = False
+    TIMELINE_TRIM_ASYNC = False
+    TYPEAHEAD_REFRESH_INTERVAL = 0
+    STORY_SWEEP_INTERVAL = 0
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setattr(TestConfig, 'UPLOAD_FOLDER', str(tmp_path / 'uploads'))
+    app = create_app(TestConfig)
+    with app.app_context():
+        db.create_all()
+        yield app
+        db.session.remove()
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+@pytest.fixture
+def register(client):
+    def register(username):
+        response = client.post('/api/register', json={
+            'username': username,
+            'email': f'{username}@example.com',
+            'password': 'password1',
+            'first_name': username.title(),
+            'last_name': 'Doe'
+        })
+        assert response.status_code == 201, response.json
+        return response.json['user_id']
+    return register
+
+@pytest.fixture
+def auth(app):
+    def auth(user_id):
+        return {'Authorization': f'Bearer {create_access_token(identity=user_id)}'}
+    return auth
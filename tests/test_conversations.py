@@ -0,0 +1,78 @@
+from backend import conversations, db
+from backend.models import Conversation
+
+def test_first_message_race_reuses_the_other_writers_row(client, register, auth, monkeypatch):
+    alice, bob = register('alice'), register('bob')
+    # Another request created bob's row between our lookup and our insert
+    db.session.execute(db.insert(Conversation).values(user_id=bob, partner_id=alice, unread_count=2))
+    db.session.commit()
+    find = conversations._find
+    misses = {(bob, alice)}
+    def racing_find(user_id, partner_id):
+        if (user_id, partner_id) in misses:
+            misses.discard((user_id, partner_id))
+            return None
+        return find(user_id, partner_id)
+    monkeypatch.setattr(conversations, '_find', racing_find)
+
+    response = client.post('/api/messages', json={'receiver_id': bob, 'content': 'hi'}, headers=auth(alice))
+    assert response.status_code == 201
+
+    rows = {(c.user_id, c.partner_id): c for c in Conversation.query}
+    assert set(rows) == {(alice, bob), (bob, alice)}
+    assert rows[(bob, alice)].unread_count == 3
+    assert rows[(alice, bob)].unread_count == 0
+    assert rows[(bob, alice)].last_message_snippet == 'hi'
+
+def send(client, headers, receiver_id, content):
+    response = client.post('/api/messages', json={'receiver_id': receiver_id, 'content': content}, headers=headers)
+    assert response.status_code == 201
+    return response.json['message_id']
+
+def test_inbox_is_ordered_by_latest_message_with_unread_counts(client, register, auth):
+    alice, bob, carol = register('alice'), register('bob'), register('carol')
+    send(client, auth(bob), alice, 'hi alice')
+    send(client, auth(carol), alice, 'hey')
+    send(client, auth(bob), alice, 'x' * 80)
+    send(client, auth(alice), carol, 'hey carol')
+
+    inbox = client.get('/api/conversations', headers=auth(alice)).json['conversations']
+    assert [(c['user']['id'], c['unread_count'], c['last_message']['is_own']) for c in inbox] == [
+        (carol, 1, True), (bob, 2, False)
+    ]
+    assert inbox[1]['last_message']['content'] == 'x' * 50 + '...'
+
+    client.get(f'/api/messages/{bob}', headers=auth(alice))
+    inbox = client.get('/api/conversations', headers=auth(alice)).json['conversations']
+    assert {c['user']['id']: c['unread_count'] for c in inbox} == {carol: 1, bob: 0}
+
+def test_rebuild_conversations_matches_the_live_index(app, client, register, auth):
+    alice, bob = register('alice'), register('bob')
+    send(client, auth(bob), alice, 'one')
+    send(client, auth(alice), bob, 'two')
+    send(client, auth(bob), alice, 'three')
+    before = client.get('/api/conversations', headers=auth(alice)).json
+
+    Conversation.query.delete()
+    db.session.commit()
+    result = app.test_cli_runner().invoke(args=['rebuild-conversations'])
+    assert result.exit_code == 0, result.output
+
+    assert client.get('/api/conversations', headers=auth(alice)).json == before
+
+def test_delta_sync_returns_only_newer_messages(client, register, auth):
+    alice, bob = register('alice'), register('bob')
+    first = send(client, auth(bob), alice, 'one')
+    response = client.get(f'/api/messages/{bob}', headers=auth(alice))
+    assert response.json['latest_id'] == first
+
+    second = send(client, auth(bob), alice, 'two')
+    third = send(client, auth(alice), bob, 'three')
+    response = client.get(f'/api/messages/{bob}?since_id={first}', headers=auth(alice))
+    assert [m['id'] for m in response.json['messages']] == [second, third]
+    assert response.json['latest_id'] == third
+    assert response.json['has_more'] is False
+
+    response = client.get(f'/api/messages/{bob}?since_id={third}', headers=auth(alice))
+    assert response.json['messages'] == []
+    assert response.json['latest_id'] == third
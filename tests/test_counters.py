@@ -0,0 +1,49 @@
+from backend import db
+from backend.models import Comment, Post, User
+
+def counters(model, row_id, *names):
+    db.session.expire_all()
+    row = db.session.get(model, row_id)
+    return {name: getattr(row, name) for name in names}
+
+def test_activity_keeps_counters_in_step(client, register, auth):
+    alice, bob, carol = register('alice'), register('bob'), register('carol')
+    post_id = client.post('/api/posts', json={'content': 'Hello'}, headers=auth(alice)).json['post_id']
+
+    client.post(f'/api/posts/{post_id}/react', json={'reaction_type': 'like'}, headers=auth(bob))
+    client.post(f'/api/posts/{post_id}/react', json={'reaction_type': 'love'}, headers=auth(carol))
+    client.post(f'/api/posts/{post_id}/react', json={'reaction_type': 'haha'}, headers=auth(bob))
+    client.post(f'/api/posts/{post_id}/react', json={'reaction_type': 'love'}, headers=auth(carol))
+    comment_id = client.post(f'/api/posts/{post_id}/comments', json={'content': 'Nice'}, headers=auth(bob)).json['comment_id']
+    client.post(f'/api/posts/{post_id}/comments', json={'content': 'Agreed', 'parent_id': comment_id}, headers=auth(carol))
+    client.post(f'/api/comments/{comment_id}/like', headers=auth(alice))
+    client.post(f'/api/posts/{post_id}/share', json={}, headers=auth(carol))
+
+    assert counters(Post, post_id, 'likes_count', 'reaction_haha', 'reaction_like', 'reaction_love', 'comments_count', 'shares_count') == {
+        'likes_count': 1, 'reaction_haha': 1, 'reaction_like': 0, 'reaction_love': 0, 'comments_count': 2, 'shares_count': 1
+    }
+    assert counters(Comment, comment_id, 'likes_count', 'replies_count') == {'likes_count': 1, 'replies_count': 1}
+    # Reactions and comments on the post each fold into one notification
+    assert counters(User, alice, 'posts_count', 'unread_notifications_count') == {'posts_count': 1, 'unread_notifications_count': 3}
+
+def test_rebuild_counters_repairs_drift(app, client, register, auth):
+    alice, bob = register('alice'), register('bob')
+    post_id = client.post('/api/posts', json={'content': 'Hello'}, headers=auth(alice)).json['post_id']
+    client.post(f'/api/posts/{post_id}/react', json={'reaction_type': 'wow'}, headers=auth(bob))
+    comment_id = client.post(f'/api/posts/{post_id}/comments', json={'content': 'Nice'}, headers=auth(bob)).json['comment_id']
+    client.post(f'/api/follow/{alice}', headers=auth(bob))
+
+    db.session.execute(db.update(Post).values(likes_count=7, reaction_wow=0, comments_count=0))
+    db.session.execute(db.update(Comment).values(replies_count=3))
+    db.session.execute(db.update(User).values(posts_count=0, followers_count=0, following_count=5, unread_notifications_count=9))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['rebuild-counters'])
+    assert result.exit_code == 0, result.output
+
+    assert counters(Post, post_id, 'likes_count', 'reaction_wow', 'comments_count') == {'likes_count': 1, 'reaction_wow': 1, 'comments_count': 1}
+    assert counters(Comment, comment_id, 'replies_count') == {'replies_count': 0}
+    assert counters(User, alice, 'posts_count', 'followers_count', 'following_count', 'unread_notifications_count') == {
+        'posts_count': 1, 'followers_count': 1, 'following_count': 0, 'unread_notifications_count': 3
+    }
+    assert counters(User, bob, 'following_count', 'unread_notifications_count') == {'following_count': 1, 'unread_notifications_count': 0}
@@ -0,0 +1,27 @@
+from sqlalchemy import event
+from backend.extensions import db
+
+def test_feed_query_count_does_not_grow_with_authors(app, client, register, auth):
+    reader = register('reader')
+    statements = []
+
+    def feed_statements():
+        statements.clear()
+        listener = lambda *args: statements.append(args[2])
+        event.listen(db.engine, 'before_cursor_execute', listener)
+        try:
+            assert client.get('/api/feed', headers=auth(reader)).status_code == 200
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', listener)
+        return len(statements)
+
+    def add_author(name):
+        author = register(name)
+        client.post(f'/api/follow/{author}', headers=auth(reader))
+        client.post('/api/posts', json={'content': f'hello from {name}'}, headers=auth(author))
+
+    add_author('alice')
+    baseline = feed_statements()
+    for name in ('bob', 'carol', 'dave'):
+        add_author(name)
+    assert feed_statements() == baseline
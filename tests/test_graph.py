@@ -0,0 +1,40 @@
+from array import array
+from backend.extensions import db
+from backend.graph import follow, graph_cache
+
+def test_follow_invalidates_the_cache_after_commit(app, register):
+    alice, bob = register('alice'), register('bob')
+    follow(alice, bob)
+
+    # A concurrent reader re-fills the entry from the old edges before our commit
+    graph_cache.store.set_many({alice: array('i')})
+    assert not graph_cache.is_following(alice, bob)
+
+    db.session.commit()
+    assert graph_cache.is_following(alice, bob)
+
+def test_relationships_endpoint(client, register, auth):
+    alice, bob, carol, dave, erin, frank = (register(name) for name in ('alice', 'bob', 'carol', 'dave', 'erin', 'frank'))
+    client.post('/api/friends/request', json={'friend_id': bob}, headers=auth(alice))
+    friendship_id = client.get('/api/friends/requests', headers=auth(bob)).json['friend_requests'][0]['id']
+    client.put(f'/api/friends/accept/{friendship_id}', headers=auth(bob))
+    client.post('/api/friends/request', json={'friend_id': carol}, headers=auth(alice))
+    client.post('/api/friends/request', json={'friend_id': alice}, headers=auth(dave))
+    client.post(f'/api/follow/{erin}', headers=auth(alice))
+    client.post(f'/api/follow/{alice}', headers=auth(erin))
+
+    response = client.get(f'/api/relationships?ids={bob},{carol},{dave},{erin},{frank},{alice}', headers=auth(alice))
+    assert response.status_code == 200
+    state = {int(user_id): s for user_id, s in response.json['relationships'].items()}
+    assert set(state) == {bob, carol, dave, erin, frank}
+    assert state[bob]['is_friend'] and state[bob]['friendship_id'] == friendship_id
+    assert (state[carol]['request'], state[dave]['request']) == ('sent', 'received')
+    assert state[erin]['is_following'] and state[erin]['follows_you'] and not state[erin]['is_friend']
+    assert state[frank] == {'is_friend': False, 'request': None, 'friendship_id': None, 'is_following': False, 'follows_you': False}
+
+def test_relationships_rejects_bad_ids(client, register, auth):
+    headers = auth(register('alice'))
+    assert client.get('/api/relationships?ids=1,two', headers=headers).status_code == 400
+    ids = ','.join(str(user_id) for user_id in range(1, 502))
+    assert client.get(f'/api/relationships?ids={ids}', headers=headers).status_code == 400
+    assert client.get('/api/relationships', headers=headers).json == {'relationships': {}}
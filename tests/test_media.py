@@ -0,0 +1,84 @@
+import io
+from concurrent.futures import Future
+import pytest
+from PIL import Image
+from backend import db
+from backend.media import InvalidImage, media_pipeline, render_variants
+from backend.models import MediaBlob
+from backend.storage import blob_key
+
+def jpeg_bytes(size=(400, 300)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 40, 40)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+def upload(client, headers, data, filename='photo.jpg'):
+    return client.post('/api/upload/post-image', data={'file': (io.BytesIO(data), filename)},
+                       headers=headers, content_type='multipart/form-data')
+
+@pytest.mark.parametrize('data', [b'not an image', jpeg_bytes()[:200]])
+def test_undecodable_upload_is_rejected(client, register, auth, data):
+    response = upload(client, auth(register('alice')), data)
+    assert response.status_code == 400
+    assert response.json['message'] == 'The file is not a valid image'
+
+def test_write_errors_are_not_reported_as_invalid_images(tmp_path):
+    source = tmp_path / 'photo.jpg'
+    source.write_bytes(jpeg_bytes())
+    with pytest.raises(OSError) as raised:
+        render_variants(str(source), 'post', str(tmp_path / 'missing'), 'key')
+    assert not isinstance(raised.value, InvalidImage)
+
+def test_processing_timeout_is_a_503(app, client, register, auth, monkeypatch):
+    class StuckExecutor:
+        def submit(self, *args):
+            return Future()
+    app.config.update(MEDIA_POOL_SIZE=1, MEDIA_PROCESS_TIMEOUT=0)
+    monkeypatch.setattr(media_pipeline, '_executor', StuckExecutor())
+
+    response = upload(client, auth(register('alice')), jpeg_bytes())
+    assert response.status_code == 503
+    assert 'timed out' in response.json['message']
+
+def refcount(key):
+    db.session.expire_all()
+    return MediaBlob.query.filter_by(key=key).one().refcount
+
+def test_identical_uploads_share_a_refcounted_blob(app, client, register, auth):
+    headers = auth(register('alice'))
+    urls = {upload(client, headers, jpeg_bytes()).json['url'] for _ in range(2)}
+    assert len(urls) == 1
+    url = urls.pop()
+    key = blob_key(url)
+    assert MediaBlob.query.count() == 1
+
+    post_ids = [client.post('/api/posts', json={'content': 'pic', 'images': [url]}, headers=headers).json['post_id'] for _ in range(2)]
+    assert refcount(key) == 2
+
+    client.delete(f'/api/posts/{post_ids[0]}', headers=headers)
+    assert refcount(key) == 1
+    client.delete(f'/api/posts/{post_ids[1]}', headers=headers)
+    assert refcount(key) == 0
+    assert client.get(url).status_code == 200
+
+    result = app.test_cli_runner().invoke(args=['gc-media', '--grace', '0'])
+    assert result.exit_code == 0, result.output
+    assert result.output.startswith('Deleted 1 blobs')
+    assert MediaBlob.query.count() == 0
+    assert client.get(url).status_code == 404
+
+def test_gc_recounts_references_and_keeps_recent_uploads(app, client, register, auth):
+    headers = auth(register('alice'))
+    kept = upload(client, headers, jpeg_bytes()).json['url']
+    fresh = upload(client, headers, jpeg_bytes((300, 300))).json['url']
+    client.post('/api/posts', json={'content': 'pic', 'images': [kept]}, headers=headers)
+    db.session.execute(db.update(MediaBlob).values(refcount=5))
+    db.session.commit()
+
+    result = app.test_cli_runner().invoke(args=['gc-media'])
+    assert result.output.startswith('Deleted 0 blobs')
+
+    assert refcount(blob_key(kept)) == 1
+    # Not referenced yet, but younger than MEDIA_GC_GRACE: its post may still be on the way
+    assert refcount(blob_key(fresh)) == 0
+    assert client.get(fresh).status_code == 200
@@ -0,0 +1,75 @@
+import json
+import os
+import queue
+import subprocess
+import sys
+import time
+import fakeredis
+import pytest
+import redis
+import socketio
+from backend.extensions import create_external_emitter
+
+# Set REDIS_URL to run these against a real Redis instead of the in-process fake
+REDIS_URL = os.environ.get('REDIS_URL')
+CHANNEL = 'flask-socketio'
+
+@pytest.fixture
+def queue_url(monkeypatch):
+    if REDIS_URL:
+        return REDIS_URL
+    # Every client, including the Socket.IO managers', talks to one in-process server
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(redis.Redis, 'from_url', classmethod(lambda cls, url, **kwargs: fakeredis.FakeRedis(server=server)))
+    return 'redis://queue.test:6379/0'
+
+@pytest.fixture
+def worker(queue_url):
+    """Another web worker's Socket.IO server, with one client in room user_7 and one in user_8."""
+    server = socketio.Server(async_mode='threading', client_manager=socketio.RedisManager(queue_url, channel=CHANNEL))
+    sent = queue.Queue()
+    server._send_eio_packet = lambda eio_sid, packet: sent.put((eio_sid, json.loads(packet.data[1:])))
+    server.manager.initialize()
+    for eio_sid, room in (('eio-7', 'user_7'), ('eio-8', 'user_8')):
+        sid = server.manager.connect(eio_sid, '/')
+        server.manager.enter_room(sid, '/', room)
+
+    # The listener subscribes from its own thread
+    client = redis.Redis.from_url(queue_url)
+    deadline = time.monotonic() + 5
+    while dict(client.pubsub_numsub(CHANNEL)).get(CHANNEL.encode(), 0) < 1:
+        assert time.monotonic() < deadline, 'worker never subscribed'
+        time.sleep(0.01)
+    return sent
+
+def emit_from_this_process(url):
+    create_external_emitter(url).emit('new_notification', {'content': 'hi'}, room='user_7')
+
+def emit_from_another_process(url):
+    if not REDIS_URL:
+        pytest.skip('needs a real Redis (REDIS_URL) to share the queue across processes')
+    subprocess.run([sys.executable, '-c', (
+        'import sys; from backend.extensions import create_external_emitter; '
+        "create_external_emitter(sys.argv[1]).emit('new_notification', {'content': 'hi'}, room='user_7')"
+    ), url], check=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.mark.parametrize('emit', [emit_from_this_process, emit_from_another_process])
+def test_emit_reaches_only_the_room_on_another_worker(queue_url, worker, emit):
+    emit(queue_url)
+
+    assert worker.get(timeout=5) == ('eio-7', ['new_notification', {'content': 'hi'}])
+    time.sleep(0.2)
+    assert worker.empty()
+
+def test_check_message_queue_round_trip(app, queue_url):
+    app.config['SOCKETIO_MESSAGE_QUEUE'] = queue_url
+    result = app.test_cli_runner().invoke(args=['check-message-queue'])
+    assert result.exit_code == 0, result.output
+    assert 'Message queue OK' in result.output
+
+def test_check_message_queue_unreachable(app):
+    app.config['SOCKETIO_MESSAGE_QUEUE'] = 'redis://127.0.0.1:1/0'
+    result = app.test_cli_runner().invoke(args=['check-message-queue'])
+    assert result.exit_code == 1
+    assert 'Cannot reach the message queue at redis://127.0.0.1:1/0' in result.output
+    assert 'Traceback' not in result.output
@@ -0,0 +1,28 @@
+import pytest
+from sqlalchemy.exc import OperationalError
+from backend.extensions import db, limiter
+
+@pytest.fixture
+def metrics_headers(app):
+    app.config['METRICS_TOKEN'] = 'scrape-token'
+    return {'Authorization': 'Bearer scrape-token'}
+
+def test_metrics_require_the_token(client, metrics_headers):
+    assert client.get('/api/_metrics').status_code == 401
+    assert client.get('/api/_metrics', headers={'Authorization': 'Bearer wrong'}).status_code == 401
+    response = client.get('/api/_metrics', headers=metrics_headers)
+    assert response.status_code == 200
+    assert 'faceconnect_http_requests_total{endpoint="main.api_metrics",method="GET",status="401"} 2' in response.get_data(as_text=True)
+
+def test_metrics_are_not_rate_limited(app, client, metrics_headers):
+    app.config['RATELIMIT_ENABLED'] = True
+    limiter.init_app(app)
+    for _ in range(60):
+        assert client.get('/api/_metrics', headers=metrics_headers).status_code == 200
+        assert client.get('/api/_metrics/slow-queries', headers=metrics_headers).status_code == 200
+
+def test_failed_statements_do_not_leak_timers(app):
+    with db.engine.connect() as conn:
+        with pytest.raises(OperationalError):
+            conn.exec_driver_sql('SELECT * FROM no_such_table')
+        assert not conn.info.get('query_start')
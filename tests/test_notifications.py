@@ -0,0 +1,80 @@
+from backend import db
+from backend.helpers import create_notification
+from backend.models import Notification, NotificationActor, NotificationIntent
+from backend.outbox import outbox
+
+def test_tagging_several_users_notifies_each_once(client, register, auth):
+    author = register('alice')
+    tagged = [register(name) for name in ('bob', 'carol', 'dave')]
+
+    response = client.post('/api/posts', json={'content': 'Road trip!', 'tagged_users': tagged}, headers=auth(author))
+    assert response.status_code == 201
+
+    notifications = Notification.query.filter_by(type='tag').order_by(Notification.user_id).all()
+    assert [n.user_id for n in notifications] == tagged
+    assert [n.actor_count for n in notifications] == [1, 1, 1]
+    assert NotificationActor.query.count() == 3
+    assert {(a.notification_id, a.user_id) for a in NotificationActor.query} == {(n.id, author) for n in notifications}
+
+def test_intent_rolls_back_with_the_triggering_write(app, register):
+    alice, bob = register('alice'), register('bob')
+
+    create_notification(bob, alice, 'follow', 'started following you', f'/profile/{alice}')
+    db.session.rollback()
+    outbox.flush()
+
+    assert Notification.query.count() == 0
+    assert NotificationIntent.query.count() == 0
+
+def test_failing_intent_is_kept_as_failed(app, register, monkeypatch):
+    alice, bob = register('alice'), register('bob')
+    write = outbox._write
+    def failing_write(batch):
+        if any(row.type == 'broken' for row in batch):
+            raise ValueError('cannot render')
+        return write(batch)
+    monkeypatch.setattr(outbox, '_write', failing_write)
+
+    create_notification(bob, alice, 'broken', 'never renders')
+    create_notification(bob, alice, 'follow', 'started following you', f'/profile/{alice}')
+    db.session.commit()
+    for _ in range(app.config['NOTIFICATION_MAX_RETRIES']):
+        outbox.flush()
+
+    assert [n.type for n in Notification.query] == ['follow']
+    failed = NotificationIntent.query.one()
+    assert failed.type == 'broken'
+    assert failed.attempts == app.config['NOTIFICATION_MAX_RETRIES']
+    assert failed.failed_at is not None
+    assert 'cannot render' in failed.error
+
+    monkeypatch.setattr(outbox, '_write', write)
+    assert outbox.retry_failed() == 1
+    outbox.flush()
+    assert NotificationIntent.query.count() == 0
+    assert sorted(n.type for n in Notification.query) == ['broken', 'follow']
+
+def test_mark_read_up_to_id(client, register, auth):
+    alice, bob = register('alice'), register('bob')
+    for post_id in range(1, 4):
+        create_notification(bob, alice, 'tag', 'tagged you in a post', f'/post/{post_id}')
+        db.session.commit()
+        outbox.flush()
+    first, second, third = [n.id for n in Notification.query.order_by(Notification.id)]
+
+    response = client.put('/api/notifications/read', json={'up_to_id': str(second)}, headers=auth(bob))
+    assert response.status_code == 200
+    assert response.json['updated'] == 2
+
+    response = client.put('/api/notifications/read', json={}, headers=auth(bob))
+    assert response.json['updated'] == 1
+
+def test_mark_read_rejects_bad_input(client, register, auth):
+    bob = register('bob')
+    for body in ({'up_to_id': 'latest'}, {'up_to_id': None}, {'up_to_id': [1]}, [1]):
+        response = client.put('/api/notifications/read', json=body, headers=auth(bob))
+        assert response.status_code == 400
+        assert 'message' in response.json
+
+    response = client.put('/api/notifications/read', headers=auth(bob))
+    assert response.status_code == 400
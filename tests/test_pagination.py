@@ -0,0 +1,49 @@
+from datetime import datetime
+from backend import db
+from backend.models import Post
+
+def create_posts(client, headers, count):
+    return [client.post('/api/posts', json={'content': f'post {i}'}, headers=headers).json['post_id'] for i in range(count)]
+
+def test_cursor_walk_is_stable_across_inserts_and_timestamp_ties(client, register, auth):
+    alice = register('alice')
+    headers = auth(alice)
+    post_ids = create_posts(client, headers, 7)
+    # Same timestamp everywhere, so the id tie-breaker decides the order
+    db.session.execute(db.update(Post).values(created_at=datetime(2024, 1, 1)))
+    db.session.commit()
+
+    seen = []
+    response = client.get('/api/feed?per_page=3', headers=headers)
+    while True:
+        assert response.status_code == 200
+        seen.extend(post['id'] for post in response.json['posts'])
+        if not response.json['has_next']:
+            assert response.json['next_cursor'] is None
+            break
+        # A post arriving mid-walk belongs before the first page and must not shift later ones
+        create_posts(client, headers, 1)
+        response = client.get(f"/api/feed?per_page=3&cursor={response.json['next_cursor']}", headers=headers)
+
+    assert seen == sorted(post_ids, reverse=True)
+    assert 'current_page' not in response.json
+
+def test_page_numbers_and_total(client, register, auth):
+    alice = register('alice')
+    headers = auth(alice)
+    post_ids = create_posts(client, headers, 5)
+
+    response = client.get('/api/feed?page=2&per_page=2&include_total=1', headers=headers)
+    assert [post['id'] for post in response.json['posts']] == sorted(post_ids, reverse=True)[2:4]
+    assert response.json['current_page'] == 2
+    assert response.json['has_prev'] is True
+    assert response.json['has_next'] is True
+    assert (response.json['total'], response.json['pages']) == (5, 3)
+
+    response = client.get('/api/feed?per_page=2', headers=headers)
+    assert 'total' not in response.json
+
+def test_invalid_cursor_is_a_400(client, register, auth):
+    response = client.get('/api/feed?cursor=not-a-cursor', headers=auth(register('alice')))
+    assert response.status_code == 400
+    assert response.json['message'] == 'Invalid pagination cursor'
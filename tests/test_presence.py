@@ -0,0 +1,21 @@
+from backend.extensions import db
+from backend.models import User
+from backend.presence import presence
+from backend.sockets.handlers import _user_id
+
+def test_flush_skips_unknown_users(app, register):
+    user_id = register('alice')
+    presence.heartbeat(user_id)
+    presence.heartbeat(999)
+    presence.flush()
+
+    assert not presence._dirty
+    db.session.expire_all()
+    user = db.session.get(User, user_id)
+    assert user.is_online and user.last_seen is not None
+
+def test_socket_user_ids_must_be_integers():
+    assert _user_id({'user_id': 7}) == 7
+    assert _user_id({'user_id': '7'}) is None
+    assert _user_id({'user_id': True}) is None
+    assert _user_id(None) is None
@@ -0,0 +1,23 @@
+import pytest
+from backend.extensions import db
+from backend.search import SearchSchemaMissing, search_index
+
+@pytest.fixture
+def without_search_tables(app):
+    db.session.execute(db.text('DROP TABLE user_fts'))
+    db.session.execute(db.text('DROP TABLE post_fts'))
+    db.session.commit()
+    search_index._schema_ready = False
+
+def test_missing_search_tables_fail_clearly(app, client, without_search_tables):
+    with pytest.raises(SearchSchemaMissing):
+        client.post('/api/register', json={
+            'username': 'alice', 'email': 'alice@example.com', 'password': 'password1',
+            'first_name': 'Alice', 'last_name': 'Doe'
+        })
+
+def test_rebuild_creates_missing_search_tables(app, register, without_search_tables):
+    result = app.test_cli_runner().invoke(args=['rebuild-search-index'])
+    assert result.exit_code == 0, result.output
+    register('alice')
+    assert search_index.search_users('ali')[0]
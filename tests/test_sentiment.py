@@ -0,0 +1,24 @@
+import pytest
+from backend import db, sentiment
+from backend.models import Post
+from backend.sentiment import sentiment_scorer
+
+def test_failed_batch_is_requeued(app, register, monkeypatch):
+    author = register('alice')
+    post = Post(user_id=author, content='What a lovely day')
+    db.session.add(post)
+    db.session.commit()
+
+    def unavailable(texts):
+        raise RuntimeError('scorer unavailable')
+    monkeypatch.setattr(sentiment, 'polarities', unavailable)
+    with pytest.raises(RuntimeError):
+        sentiment_scorer.enqueue(post.id)
+    assert list(sentiment_scorer._pending) == [post.id]
+    assert db.session.get(Post, post.id).sentiment is None
+
+    monkeypatch.setattr(sentiment, 'polarities', lambda texts: [0.5 for _ in texts])
+    sentiment_scorer.flush()
+    assert not sentiment_scorer._pending
+    db.session.expire_all()
+    assert db.session.get(Post, post.id).sentiment == 0.5
@@ -0,0 +1,42 @@
+import os
+from collections import OrderedDict
+import pytest
+from backend import serving
+from backend.extensions import limiter
+
+def test_uploads_are_not_rate_limited(app, client):
+    app.config['RATELIMIT_ENABLED'] = True
+    limiter.init_app(app)
+    os.makedirs(os.path.join(app.config['UPLOAD_FOLDER'], 'posts'))
+    path = os.path.join(app.config['UPLOAD_FOLDER'], 'posts', 'photo.jpg')
+    with open(path, 'wb') as handle:
+        handle.write(b'\xff\xd8 not really a jpeg')
+
+    for _ in range(60):
+        assert client.get('/uploads/posts/photo.jpg').status_code == 200
+
+@pytest.mark.parametrize('filename', ['tmp/upload.jpg', 'loose.jpg', 'blobs/../tmp/upload.jpg'])
+def test_only_media_folders_are_served(app, client, filename):
+    upload_folder = app.config['UPLOAD_FOLDER']
+    for name in ('tmp/upload.jpg', 'loose.jpg'):
+        with open(os.path.join(upload_folder, name), 'wb') as handle:
+            handle.write(b'in progress')
+
+    assert client.get(f'/uploads/{filename}').status_code == 404
+
+def test_etag_cache_is_bounded_and_keyed_on_mtime(app, tmp_path, monkeypatch):
+    monkeypatch.setattr(serving, '_hashes', OrderedDict())
+    app.config['MEDIA_ETAG_CACHE_SIZE'] = 2
+    paths = []
+    for index in range(3):
+        path = tmp_path / f'asset{index}.js'
+        path.write_text(f'console.log({index})')
+        paths.append(str(path))
+        serving.file_etag(str(path))
+    assert [key[0] for key in serving._hashes] == paths[1:]
+
+    before = serving.file_etag(paths[2])
+    with open(paths[2], 'w') as handle:
+        handle.write('console.log("changed")')
+    os.utime(paths[2], ns=(1, 1))
+    assert serving.file_etag(paths[2]) != before
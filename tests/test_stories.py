@@ -0,0 +1,70 @@
+import pytest
+from backend import db, start_background_tasks, stories
+from backend.extensions import socketio
+from backend.models import Story, StoryView
+from backend.stories import StorySweeper, story_sweeper, story_views
+
+def test_sweeper_starts_with_the_server_only_once(app, monkeypatch):
+    started = []
+    monkeypatch.setattr(socketio, 'start_background_task', lambda target: started.append(target))
+    monkeypatch.setattr(story_sweeper, '_started', False)
+    app.config['STORY_SWEEP_INTERVAL'] = 300
+
+    StorySweeper(app)
+    assert started == []
+
+    start_background_tasks(app)
+    start_background_tasks(app)
+    assert started == [story_sweeper._run]
+
+@pytest.fixture
+def buffered_views(app, monkeypatch):
+    app.config['STORY_VIEWS_ASYNC'] = True
+    monkeypatch.setattr(story_views, '_pending', set())
+    # Flushed by hand instead of by the background task
+    monkeypatch.setattr(story_views, '_worker_started', True)
+    return story_views
+
+def create_story(client, headers):
+    return client.post('/api/stories', json={'text': 'Hello'}, headers=headers).json['story_id']
+
+def test_repeated_views_coalesce_into_one_row(client, register, auth, buffered_views):
+    alice, bob, carol = register('alice'), register('bob'), register('carol')
+    story_id = create_story(client, auth(alice))
+
+    for viewer in (bob, bob, carol, bob):
+        assert client.post(f'/api/stories/{story_id}/view', headers=auth(viewer)).status_code == 200
+    assert buffered_views._pending == {(story_id, bob), (story_id, carol)}
+    assert StoryView.query.count() == 0
+
+    buffered_views.flush()
+    client.post(f'/api/stories/{story_id}/view', headers=auth(bob))
+    buffered_views.flush()
+
+    response = client.get(f'/api/stories/{story_id}/viewers', headers=auth(alice))
+    assert response.json['views_count'] == 2
+    assert sorted(viewer['id'] for viewer in response.json['viewers']) == [bob, carol]
+
+def test_views_of_swept_stories_are_dropped(client, register, auth, buffered_views):
+    alice, bob = register('alice'), register('bob')
+    kept, swept = create_story(client, auth(alice)), create_story(client, auth(alice))
+    for story_id in (kept, swept):
+        client.post(f'/api/stories/{story_id}/view', headers=auth(bob))
+    Story.query.filter_by(id=swept).delete()
+    db.session.commit()
+
+    buffered_views.flush()
+    assert [(view.story_id, view.user_id) for view in StoryView.query] == [(kept, bob)]
+    assert not buffered_views._pending
+
+def test_failed_flush_keeps_the_views(client, register, auth, buffered_views, monkeypatch):
+    alice, bob = register('alice'), register('bob')
+    story_id = create_story(client, auth(alice))
+    client.post(f'/api/stories/{story_id}/view', headers=auth(bob))
+
+    def unavailable(views):
+        raise RuntimeError('database unavailable')
+    monkeypatch.setattr(stories, 'insert_story_views', unavailable)
+    with pytest.raises(RuntimeError):
+        buffered_views.flush()
+    assert buffered_views._pending == {(story_id, bob)}
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import event
+from backend.extensions import db
+from backend.models import Post, TimelineEntry
+
+@pytest.fixture
+def fanout(app):
+    app.config.update(TIMELINE_FANOUT_ENABLED=True, TIMELINE_MAX_LENGTH=3)
+
+def test_feed_pulls_posts_older_than_the_trimmed_timeline(app, client, register, auth, fanout):
+    author = register('alice')
+    reader = register('bob')
+    assert client.post(f'/api/follow/{author}', headers=auth(reader)).status_code in (200, 201)
+
+    for i in range(5):
+        assert client.post('/api/posts', json={'content': f'post {i}'}, headers=auth(author)).status_code == 201
+    # Distinct timestamps so the order is deterministic
+    for i, post in enumerate(Post.query.order_by(Post.id)):
+        post.created_at = datetime(2026, 1, 1) + timedelta(minutes=i)
+        TimelineEntry.query.filter_by(post_id=post.id).update({'created_at': post.created_at})
+    db.session.commit()
+
+    assert TimelineEntry.query.filter_by(user_id=reader).count() == 3
+
+    seen = []
+    cursor = None
+    while True:
+        response = client.get('/api/feed', query_string={'per_page': 2, 'cursor': cursor} if cursor else {'per_page': 2}, headers=auth(reader))
+        assert response.status_code == 200
+        seen += [post['content'] for post in response.json['posts']]
+        cursor = response.json['next_cursor']
+        if not cursor:
+            break
+    assert seen == [f'post {i}' for i in reversed(range(5))]
+
+def test_feed_pages_read_the_timeline_through_its_index(app, client, register, auth, fanout):
+    app.config['TIMELINE_MAX_LENGTH'] = 100
+    author = register('alice')
+    reader = register('bob')
+    client.post(f'/api/follow/{author}', headers=auth(reader))
+    for i in range(5):
+        client.post('/api/posts', json={'content': f'post {i}'}, headers=auth(author))
+
+    statements = []
+    listener = lambda conn, cursor, statement, parameters, context, executemany: statements.append((statement, parameters))
+    event.listen(db.engine, 'before_cursor_execute', listener)
+    try:
+        response = client.get('/api/feed', query_string={'per_page': 2}, headers=auth(reader))
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', listener)
+    assert [post['content'] for post in response.json['posts']] == ['post 4', 'post 3']
+
+    plans = {}
+    with db.engine.connect() as conn:
+        for statement, parameters in statements:
+            if statement.lstrip().upper().startswith('SELECT') and ('timeline_entry' in statement or 'FROM post' in statement):
+                plans[statement] = ' | '.join(row[-1] for row in conn.exec_driver_sql('EXPLAIN QUERY PLAN ' + statement, parameters))
+
+    timeline_reads = [plan for statement, plan in plans.items() if 'FROM timeline_entry' in statement]
+    assert timeline_reads and all('INDEX ix_timeline_user_created' in plan for plan in timeline_reads)
+    assert not any('SCAN post' in plan for plan in plans.values()), plans
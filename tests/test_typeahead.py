@@ -0,0 +1,57 @@
+from backend import start_background_tasks
+from backend.extensions import db, socketio
+from backend.graph import follow, graph_cache
+from backend.typeahead import UserPrefixIndex, user_prefix_index
+
+def test_suggestions_track_new_users(client, register, auth):
+    viewer = register('alice')
+    assert client.get('/api/search/users/suggest', query_string={'q': 'bo'}, headers=auth(viewer)).json['users'] == []
+
+    register('bobby')
+    users = client.get('/api/search/users/suggest', query_string={'q': 'bo'}, headers=auth(viewer)).json['users']
+    assert [user['username'] for user in users] == ['bobby']
+
+def test_suggestions_fall_back_to_the_database_before_the_index_loads(app, client, register, auth):
+    viewer = register('alice')
+    register('bobby')
+    app.config['TYPEAHEAD_REFRESH_INTERVAL'] = 300
+    user_prefix_index._loaded_at = None
+
+    users = client.get('/api/search/users/suggest', query_string={'q': 'bobby doe'}, headers=auth(viewer)).json['users']
+    assert [user['username'] for user in users] == ['bobby']
+    assert user_prefix_index._loaded_at is None
+
+def test_circle_cache_evicts_least_recently_used_viewers(app, register, monkeypatch):
+    app.config.update(TYPEAHEAD_CIRCLE_CACHE_SIZE=2, TYPEAHEAD_MAX_EXPANDED=1)
+    users = [register(name) for name in ('alice', 'bob', 'carol', 'dave')]
+    expanded = []
+    following_many = graph_cache.following_many
+    monkeypatch.setattr(graph_cache, 'following_many', lambda ids: expanded.append(list(ids)) or following_many(ids))
+    for followed in users[1:]:
+        follow(users[0], followed)
+    db.session.commit()
+
+    user_prefix_index._circle(users[0])
+    assert expanded[-1] == [users[1]]
+
+    user_prefix_index._circle(users[1])
+    user_prefix_index._circle(users[0])
+    user_prefix_index._circle(users[2])
+    assert list(user_prefix_index._circles) == [users[0], users[2]]
+
+def test_load_skips_a_database_without_tables(app):
+    db.drop_all()
+    user_prefix_index._loaded_at = None
+    assert user_prefix_index.load() is False
+    assert user_prefix_index._loaded_at is None
+
+def test_loader_starts_with_the_server_not_the_app(app, monkeypatch):
+    started = []
+    monkeypatch.setattr(socketio, 'start_background_task', lambda target: started.append(target))
+    monkeypatch.setattr(user_prefix_index, '_started', False)
+    app.config['TYPEAHEAD_REFRESH_INTERVAL'] = 300
+
+    UserPrefixIndex(app)
+    assert started == []
+    start_background_tasks(app)
+    assert user_prefix_index._run in started